@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+#
+# Copyright (C) 2011-2013 Idiap Research Institute, Martigny, Switzerland
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Queries to the MOBIO database from asyncio applications (Python 3.4+).
+
+The queries are run by the threads of a dedicated executor, so that they do
+not block the event loop. Each thread opens its own database, since SQLite
+connections cannot be shared between threads.
+"""
+
+import asyncio
+import threading
+import concurrent.futures
+
+# the methods of the Database that can be awaited
+METHODS = ('objects', 'clients', 'models', 'tmodels', 'zobjects', 'tobjects',
+    'paths', 'reverse', 'annotations')
+
+
+class AsyncDatabase(object):
+  """Mirrors the :py:data:`METHODS` of :py:class:`bob.db.mobio.Database`, each
+  returning an ``asyncio`` future of its result.
+
+  Keyword parameters:
+
+  workers
+    The number of threads of the executor, i.e., of queries run in parallel.
+
+  loop
+    The event loop of the futures; by default, the current event loop.
+
+  kwargs
+    Passed to the constructor of the Database of each thread, e.g., the
+    ``original_directory``.
+  """
+
+  def __init__(self, workers=4, loop=None, **kwargs):
+    self.m_kwargs = kwargs
+    self.m_loop = loop
+    self.m_workers = workers
+    self.m_local = threading.local()
+    self.m_executor = concurrent.futures.ThreadPoolExecutor(workers)
+
+  def _database(self):
+    """Returns the database of the current thread, opening it on first use"""
+    db = getattr(self.m_local, 'db', None)
+    if db is None:
+      from .query import Database
+      db = self.m_local.db = Database(**self.m_kwargs)
+    return db
+
+  def call(self, method, *args, **kwargs):
+    """Runs the given method of the database in the executor, returning the
+    future of its result"""
+
+    if method not in METHODS:
+      raise ValueError("The method '%s' cannot be awaited; choose one of %s." % (method, ', '.join(METHODS)))
+    loop = self.m_loop or asyncio.get_event_loop()
+    return loop.run_in_executor(self.m_executor, lambda: getattr(self._database(), method)(*args, **kwargs))
+
+  def batch(self, requests):
+    """Runs many queries concurrently; ``requests`` is a list of tuples
+    ``(method, args, kwargs)``, in which ``args`` and ``kwargs`` may be
+    omitted. Returns the future of the list of their results, in the same
+    order, as ``asyncio.gather``."""
+
+    futures = []
+    for request in requests:
+      request = tuple(request)
+      method, args, kwargs = request[0], request[1] if len(request) > 1 else (), request[2] if len(request) > 2 else {}
+      futures.append(self.call(method, *args, **kwargs))
+    return asyncio.gather(*futures)
+
+  def _close_database(self, barrier):
+    """Closes the database of the current thread, once all threads run this
+    function, so that each of them closes its own"""
+    barrier.wait()
+    db = getattr(self.m_local, 'db', None)
+    if db is not None:
+      self.m_local.db = None
+      db.close()
+
+  def close(self):
+    """Waits for the pending queries, closes the database of each thread and
+    stops the threads of the executor"""
+
+    barrier = threading.Barrier(self.m_workers)
+    futures = [self.m_executor.submit(self._close_database, barrier) for _ in range(self.m_workers)]
+    self.m_executor.shutdown(wait=True)
+    for future in futures: future.result()
+
+def _awaitable(method):
+  def call(self, *args, **kwargs):
+    return self.call(method, *args, **kwargs)
+  call.__name__ = method
+  call.__doc__ = "Returns the future of :py:meth:`bob.db.mobio.Database.%s`" % method
+  return call
+
+for _method in METHODS:
+  setattr(AsyncDatabase, _method, _awaitable(_method))
+del _method
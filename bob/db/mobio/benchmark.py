@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+#
+# Copyright (C) 2011-2013 Idiap Research Institute, Martigny, Switzerland
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Performance measurements for the MOBIO database.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# SQL statements resembling the ones issued by the query API, parametrized by the protocol name
+_FILES = 'SELECT file.* FROM file JOIN client ON client.id = file.client_id ' \
+    'JOIN "protocolPurpose_file_association" AS a ON a.file_id = file.id ' \
+    'JOIN "protocolPurpose" AS pp ON pp.id = a."protocolPurpose_id" ' \
+    'JOIN protocol ON protocol.id = pp.protocol_id '
+_ORDER = ' ORDER BY file.client_id, file.session_id, file.speech_type, file.shot_id, file.device'
+
+QUERIES = (
+  ('world', _FILES + "WHERE client.sgroup = 'world' AND protocol.name = ? AND pp.sgroup = 'world'" + _ORDER),
+  ('enroll', _FILES + "WHERE protocol.name = ? AND pp.sgroup IN ('dev', 'eval') AND pp.purpose = 'enroll'" + _ORDER),
+  ('probe', _FILES + "WHERE protocol.name = ? AND pp.sgroup IN ('dev', 'eval') AND pp.purpose = 'probe'" + _ORDER),
+  ('tnorm', 'SELECT file.* FROM file JOIN "tmodel_file_association" AS a ON a.file_id = file.id '
+      'JOIN tmodel ON tmodel.id = a.tmodel_id JOIN protocol ON protocol.id = tmodel.protocol_id '
+      'WHERE protocol.name = ?' + _ORDER),
+)
+
+def _best(function, repeat):
+  """Returns the best wall-clock time of ``repeat`` calls to ``function``"""
+  best = None
+  for _ in range(repeat):
+    start = time.time()
+    function()
+    elapsed = time.time() - start
+    if best is None or elapsed < best: best = elapsed
+  return best
+
+def query_latency(dbfile, repeat=5):
+  """Measures the latency of typical queries directly on the given SQLite file.
+
+  Returns a dictionary with the best time in seconds for each query in
+  :py:data:`QUERIES`, executed once for each protocol, and for the reverse
+  lookup of all file paths."""
+
+  import sqlite3
+  connection = sqlite3.connect(dbfile)
+  try:
+    protocols = [r[0] for r in connection.execute('SELECT name FROM protocol ORDER BY name')]
+    paths = [r[0] for r in connection.execute('SELECT path FROM file')]
+    results = {}
+    for name, sql in QUERIES:
+      results[name] = _best(lambda: [connection.execute(sql, (p,)).fetchall() for p in protocols], repeat)
+    results['reverse'] = _best(lambda: [connection.execute('SELECT id FROM file WHERE path = ?', (p,)).fetchone() for p in paths], repeat)
+    return results
+  finally:
+    connection.close()
+
+def print_latency(results, reference=None, output=sys.stdout):
+  """Prints the results of :py:func:`query_latency`, optionally compared to some reference results"""
+
+  for name in sorted(results):
+    if reference and name in reference:
+      output.write('%-10s %10.2f ms  (before: %10.2f ms, speedup: %.2fx)\n' % (name, results[name] * 1000., reference[name] * 1000., reference[name] / max(results[name], 1e-9)))
+    else:
+      output.write('%-10s %10.2f ms\n' % (name, results[name] * 1000.))
+
+def dumplist_latency(formats=('lines', 'csv', 'jsonl', 'npy'), repeat=3):
+  """Measures the time to dump the files of all protocols in each of the
+  formats of :py:func:`bob.db.mobio.driver.write_files`, with and without the
+  construction of the paths.
+
+  Returns a dictionary with the best time in seconds for each combination,
+  including the time of the queries."""
+
+  from .query import Database
+  from .driver import write_files
+  db = Database()
+  try:
+    protocols = db.protocol_names()
+    results = {}
+    for format in formats:
+      for ids_only in ((True,) if format == 'npy' else (False, True)):
+        def dump():
+          with open(os.devnull, 'wb' if format == 'npy' else 'w') as output:
+            for protocol in protocols:
+              write_files(db.objects(protocol=protocol), output, format, ids_only=ids_only)
+        results['dump-%s%s' % (format, '-ids' if ids_only and format != 'npy' else '')] = _best(dump, repeat)
+    return results
+  finally:
+    db.close()
+
+def server_latency(repeat=3, clients=8):
+  """Measures the time to query the files of all protocols directly, through a
+  :py:class:`bob.db.mobio.server.RemoteDatabase` and through several of them
+  in parallel threads, each querying all protocols.
+
+  Returns a dictionary with the best time in seconds for each setting; the
+  server is started in a thread of this process, without cache, so that all
+  queries reach the databases of the server."""
+
+  import tempfile
+  import threading
+  from .query import Database
+  from .server import make_server, RemoteDatabase
+
+  db = Database()
+  try:
+    protocols = db.protocol_names()
+    results = {'direct': _best(lambda: [db.objects(protocol=p) for p in protocols], repeat)}
+  finally:
+    db.close()
+
+  directory = tempfile.mkdtemp()
+  address = os.path.join(directory, 'mobio.sock')
+  server = make_server(address, 0)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.start()
+  try:
+    remote = RemoteDatabase(address)
+    results['remote'] = _best(lambda: [remote.objects(protocol=p) for p in protocols], repeat)
+    remote.close()
+
+    def parallel():
+      def run():
+        client = RemoteDatabase(address)
+        for p in protocols: client.objects(protocol=p)
+        client.close()
+      threads = [threading.Thread(target=run) for _ in range(clients)]
+      for t in threads: t.start()
+      for t in threads: t.join()
+    results['remote-x%d' % clients] = _best(parallel, repeat)
+  finally:
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    os.remove(address)
+    os.rmdir(directory)
+  return results
+
+def async_latency(repeat=3, concurrency=100, workers=4):
+  """Measures the time of ``concurrency`` queries for the files of the 'dev'
+  group of the protocols, run one after the other on a Database, and run
+  concurrently on a :py:class:`bob.db.mobio.asyncdb.AsyncDatabase` (requires
+  Python 3.4+) from a single event loop.
+
+  Returns a dictionary with the best time in seconds of all queries in each
+  setting, and the mean latency of a single query among the concurrent ones in
+  the fastest run."""
+
+  import asyncio
+  from .query import Database
+  from .asyncdb import AsyncDatabase
+
+  db = Database()
+  protocols = db.protocol_names()
+  requests = [protocols[i % len(protocols)] for i in range(concurrency)]
+  results = {'sync-x%d' % concurrency: _best(lambda: [db.objects(protocol=p, groups='dev') for p in requests], repeat)}
+
+  loop = asyncio.new_event_loop()
+  adb = AsyncDatabase(workers, loop)
+  # the latencies of the queries of each run, with the time of the run
+  runs = []
+  def concurrent():
+    latencies = []
+    start = time.time()
+    futures = [adb.objects(protocol=p, groups='dev') for p in requests]
+    for f in futures: f.add_done_callback(lambda f: latencies.append(time.time() - start))
+    loop.run_until_complete(asyncio.gather(*futures))
+    runs.append((time.time() - start, latencies))
+  try:
+    results['async-x%d' % concurrency] = _best(concurrent, repeat)
+  finally:
+    adb.close()
+    loop.close()
+    db.close()
+  latencies = min(runs, key=lambda run: run[0])[1]
+  results['async-latency'] = sum(latencies) / len(latencies)
+  return results
+
+# the methods of the Database measured by :py:func:`api_latency`
+API_METHODS = ('objects', 'zobjects', 'tobjects', 'clients', 'tmodels', 'paths', 'reverse', 'annotations')
+
+def make_synthetic(dbfile, output, scale):
+  """Writes a copy of the given SQLite file to ``output``, in which the files
+  (and their associations to the protocols, subworlds and T-Norm models) are
+  replicated ``scale`` times with new ids and paths, to measure how the
+  queries scale with the number of files; the fingerprint of the new content
+  is stored"""
+
+  import shutil
+  import sqlite3
+  from .create import finalize
+
+  shutil.copyfile(dbfile, output)
+  connection = sqlite3.connect(output)
+  try:
+    columns = [r[1] for r in connection.execute('PRAGMA table_info(file)')]
+    offset = connection.execute('SELECT MAX(id) FROM file').fetchone()[0]
+    for k in range(1, scale):
+      values = ['id + %d' % (k * offset) if c == 'id' else "path || '.%d'" % k if c == 'path' else c for c in columns]
+      connection.execute('INSERT INTO file (%s) SELECT %s FROM file WHERE id <= %d' % (', '.join(columns), ', '.join(values), offset))
+      for table in ('subworld_file_association', 'tmodel_file_association', 'protocolPurpose_file_association'):
+        other = [r[1] for r in connection.execute('PRAGMA table_info("%s")' % table) if r[1] != 'file_id'][0]
+        connection.execute('INSERT INTO "%s" ("%s", file_id) SELECT "%s", file_id + %d FROM "%s" WHERE file_id <= %d' % (table, other, other, k * offset, table, offset))
+    connection.commit()
+  finally:
+    connection.close()
+  finalize(output)
+
+  # the fingerprint of the new content replaces the stored one
+  from bob.db.base.utils import session_try_nolock
+  from .models import Base, Metadata
+  from .create import add_fingerprint
+  session = session_try_nolock('sqlite', output)
+  try:
+    Base.metadata.create_all(session.get_bind(), tables=[Metadata.__table__])
+    add_fingerprint(session, 0)
+  finally:
+    session.close()
+
+def _write_annotations(files, directory, extension='.pos'):
+  """Writes dummy eye positions for the given files"""
+  for f in files:
+    filename = f.make_path(directory, extension)
+    if not os.path.exists(os.path.dirname(filename)): os.makedirs(os.path.dirname(filename))
+    with open(filename, 'w') as a:
+      a.write('10 20 30 40\n')
+
+def api_latency(dbfile=None, repeat=3, annotation_directory=None, annotations=100):
+  """Measures the query methods :py:data:`API_METHODS` of the Database on the
+  given SQLite file (by default, the installed one), for each protocol.
+
+  Each method is called for all groups (and purposes) of the protocol;
+  :py:meth:`bob.db.mobio.Database.paths` and
+  :py:meth:`bob.db.mobio.Database.reverse` look up all files of the protocol,
+  and :py:meth:`bob.db.mobio.Database.annotations` reads the annotations of
+  the first ``annotations`` files in the given directory (dummy annotations
+  are written to a temporary directory if none is given).
+
+  Returns a dictionary with the best time in seconds of each method on an open
+  database (``method/protocol``), of its first call on a database that was
+  just opened (``method/protocol/cold``), and of opening the database and
+  querying all protocol names (``open``)."""
+
+  import shutil
+  import tempfile
+  from .query import Database
+
+  db = Database(sqlite_file=dbfile)
+  protocols = db.protocol_names()
+  groups = db.groups()
+  purposes = db.purposes()
+
+  temporary = None
+  if annotation_directory is None:
+    temporary = annotation_directory = tempfile.mkdtemp()
+
+  def calls(protocol):
+    files = db.objects(protocol=protocol)
+    ids = [f.id for f in files]
+    paths = [f.path for f in files]
+    sample = files[:annotations]
+    if temporary is not None: _write_annotations(sample, temporary)
+    return {
+      'objects': lambda db: [db.objects(protocol=protocol, groups=g, purposes=u) for g in groups for u in purposes],
+      'zobjects': lambda db: [db.zobjects(protocol=protocol, groups=g) for g in ('dev', 'eval')],
+      'tobjects': lambda db: [db.tobjects(protocol=protocol, groups=g) for g in ('dev', 'eval')],
+      'clients': lambda db: [db.clients(protocol=protocol, groups=g) for g in groups],
+      'tmodels': lambda db: [db.tmodels(protocol=protocol, groups=g) for g in ('dev', 'eval')],
+      'paths': lambda db: db.paths(ids),
+      'reverse': lambda db: db.reverse(paths),
+      'annotations': lambda db: [db.annotations(f) for f in sample],
+    }
+
+  def fresh():
+    return Database(annotation_directory=annotation_directory, sqlite_file=dbfile)
+
+  def opened():
+    # the time to open a database and query it, without the time to close it
+    start = time.time()
+    new = fresh()
+    new.protocol_names()
+    elapsed = time.time() - start
+    new.close()
+    return elapsed
+
+  warm = None
+  try:
+    results = {'open': min(opened() for _ in range(repeat))}
+    warm = fresh()
+    for protocol in protocols:
+      for method, call in sorted(calls(protocol).items()):
+        # the first call on a new database, which has to load its pages from the file
+        results['%s/%s/cold' % (method, protocol)] = min(_cold(fresh, call) for _ in range(repeat))
+        call(warm)
+        results['%s/%s' % (method, protocol)] = _best(lambda: call(warm), repeat)
+    return results
+  finally:
+    if warm is not None: warm.close()
+    db.close()
+    if temporary is not None: shutil.rmtree(temporary)
+
+def _cold(open_database, call):
+  """Returns the time of a call on a newly opened database, without the time
+  to open and close it"""
+  db = open_database()
+  try:
+    start = time.time()
+    call(db)
+    return time.time() - start
+  finally:
+    db.close()
+
+def save_results(results, filename, **info):
+  """Writes the results of the measurements, together with information about
+  the setup, to the given JSON file"""
+
+  import json
+  import platform
+  data = dict(info, python=platform.python_version(), platform=platform.platform(), results=results)
+  with open(filename, 'w') as f:
+    json.dump(data, f, indent=2, sort_keys=True)
+
+def load_results(filename):
+  """Reads the results written by :py:func:`save_results`"""
+
+  import json
+  with open(filename) as f:
+    return json.load(f)['results']
+
+def regressions(results, reference, threshold=0.2, minimum=1e-3):
+  """Compares the results with the reference results of a baseline.
+
+  Returns the list of ``(name, before, after)`` of the measurements that are
+  slower than in the reference by more than the relative ``threshold``;
+  measurements that take less than ``minimum`` seconds in both are ignored,
+  since their variance is too high."""
+
+  slower = []
+  for name in sorted(results):
+    if name not in reference: continue
+    before, after = reference[name], results[name]
+    if max(before, after) >= minimum and after > before * (1. + threshold):
+      slower.append((name, before, after))
+  return slower
+
+def filelist_latency(repeat=3):
+  """Measures the time to generate the file lists of each protocol with
+  :py:func:`bob.db.mobio.generate_filelist.generate`, in a temporary
+  directory.
+
+  Returns a dictionary with the best time in seconds for each protocol; the
+  lists are generated again in each run, even though they are unchanged."""
+
+  import shutil
+  import tempfile
+  from .query import Database
+  from .generate_filelist import generate
+
+  db = Database()
+  directory = tempfile.mkdtemp()
+  try:
+    return dict(('filelist-%s' % p, _best(lambda: generate(p, directory, db=db, force=True), repeat)) for p in db.protocol_names())
+  finally:
+    db.close()
+    shutil.rmtree(directory)
+
+def trials_latency(protocol='mobile0-male', repeat=3, output=sys.stdout):
+  """Compares the expanded list of all probe and model pairs to the compact
+  lists of models and probes of :py:mod:`bob.db.mobio.filelists`, for the
+  'eval' group of the given protocol. The sizes of the files are written to
+  ``output``.
+
+  Returns a dictionary with the best time in seconds to parse the expanded
+  list, to iterate over the compact trials and to get their index arrays."""
+
+  import shutil
+  import tempfile
+  from .query import Database
+  from .generate_filelist import generate
+  from . import filelists
+
+  db = Database()
+  directory = tempfile.mkdtemp()
+  try:
+    generate(protocol, os.path.join(directory, 'expanded'), db=db)
+    generate(protocol, os.path.join(directory, 'compact'), db=db, compact=True)
+    expanded = os.path.join(directory, 'expanded', protocol, 'eval')
+    compact = os.path.join(directory, 'compact', protocol, 'eval')
+    expanded_size = os.path.getsize(os.path.join(expanded, 'for_scores.lst'))
+    compact_size = sum(os.path.getsize(os.path.join(compact, n)) for n in (filelists.MODELS, filelists.PROBES))
+    output.write('%-10s %10d bytes (expanded: %10d bytes, reduction: %.1fx)\n' % ('trials', compact_size, expanded_size, expanded_size / float(max(compact_size, 1))))
+    return {
+      'parse-expanded': _best(lambda: filelists.read_for_scores(os.path.join(expanded, 'for_scores.lst')), repeat),
+      'parse-compact': _best(lambda: list(filelists.iter_trials(compact)), repeat),
+      'parse-indices': _best(lambda: filelists.trial_indices(compact), repeat),
+    }
+  finally:
+    db.close()
+    shutil.rmtree(directory)
+
+def main(command_line_parameters = None):
+  """Executes the main function"""
+
+  from .driver import Interface
+
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  parser.add_argument('-D', '--database', metavar='FILE', default=Interface().files()[0], help="The SQLite file of the database to measure.")
+  parser.add_argument('-r', '--repeat', type=int, default=5, help="Each measurement is repeated this number of times; the best time is reported.")
+  parser.add_argument('--api', action='store_true', help="Also measure the query methods of the Database for each protocol, on a database that is already open and on a newly opened one.")
+  parser.add_argument('--scale', type=int, help="If given, the query methods of the Database are also measured on a synthetic database with this number of copies of each file.")
+  parser.add_argument('--annotations', metavar='DIR', help="The directory of the annotation files read by the measurement of the query methods; dummy annotations are used if not given.")
+  parser.add_argument('--filelists', action='store_true', help="Also measure the time to generate the file lists of each protocol.")
+  parser.add_argument('--trials', action='store_true', help="Also compare the size and parsing time of the expanded and compact trial lists.")
+  parser.add_argument('--server', action='store_true', help="Also compare the time to query all protocols directly and through the local query server.")
+  parser.add_argument('--async', dest='concurrent', action='store_true', help="Also compare the time of 100 queries run one after the other and concurrently from an asyncio event loop (requires Python 3.4+).")
+  parser.add_argument('--dumplist', action='store_true', help="Also measure the time to dump the files of all protocols in each output format of the 'dumplist' command.")
+  parser.add_argument('-o', '--output', metavar='FILE', help="If given, the results are written to this JSON file, which can be used as a --baseline later.")
+  parser.add_argument('-b', '--baseline', metavar='FILE', help="If given, the results are compared to the ones of this JSON file, and the exit status is 1 if any measurement is slower by more than the --threshold.")
+  parser.add_argument('-t', '--threshold', type=float, default=0.2, help="The relative slowdown compared to the --baseline that is reported as a regression.")
+  args = parser.parse_args(command_line_parameters)
+
+  if not os.path.exists(args.database):
+    raise IOError("The database file '%s' does not exist." % args.database)
+
+  results = query_latency(args.database, args.repeat)
+  if args.api:
+    results.update(api_latency(args.database, args.repeat, args.annotations))
+  if args.scale:
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp()
+    try:
+      synthetic = os.path.join(directory, 'synthetic.sql3')
+      make_synthetic(args.database, synthetic, args.scale)
+      results.update(('x%d/%s' % (args.scale, k), v) for k, v in api_latency(synthetic, args.repeat, args.annotations).items())
+    finally:
+      shutil.rmtree(directory)
+  if args.dumplist:
+    results.update(dumplist_latency(repeat=args.repeat))
+  if args.filelists:
+    results.update(filelist_latency(repeat=args.repeat))
+  if args.trials:
+    results.update(trials_latency(repeat=args.repeat))
+  if args.server:
+    results.update(server_latency(repeat=args.repeat))
+  if args.concurrent:
+    results.update(async_latency(repeat=args.repeat))
+
+  reference = load_results(args.baseline) if args.baseline else None
+  print_latency(results, reference)
+  if args.output:
+    save_results(results, args.output, database=args.database, repeat=args.repeat, scale=args.scale)
+  if reference is not None:
+    slower = regressions(results, reference, args.threshold)
+    for name, before, after in slower:
+      sys.stdout.write('REGRESSION %s: %.2f ms -> %.2f ms (%.2fx slower)\n' % (name, before * 1000., after * 1000., after / max(before, 1e-9)))
+    if slower: return 1
+  return 0
+
+if __name__ == "__main__":
+  main()
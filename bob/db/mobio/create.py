@@ -16,10 +16,16 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-"""This script creates the MOBIO database in a single pass.
+"""This script creates the MOBIO database in several phases; each phase is
+committed on completion, so that an interrupted build can be resumed.
 """
 
 import os
+import sys
+import time
+import functools
+import contextlib
+import collections
 
 from .models import *
 
@@ -27,97 +33,302 @@ def nodot(item):
   """Can be used to ignore hidden files, starting with the . character."""
   return item[0] != '.'
 
-def add_files(session, datadir, extensions, verbose):
-  """Add files to the MOBIO database."""
-
-  def add_file(session, datadir, location, client_id_dir, session_device, basename, verbose):
-    """Parse a single filename and add it to the list.
-       Also add a client entry if not already in the database."""
-    v = os.path.splitext(basename)[0].split('_')
-    bname = os.path.splitext(basename)[0]
-    full_bname = os.path.join(location, client_id_dir, session_device, bname)
-
-    gender = ''
-    if v[0][0] == 'm': gender = 'male'
-    if v[0][0] == 'f': gender = 'female'
-    institute = int(v[0][1])
-    institute_dir = ''
-    if institute == 0:
-      institute = 'idiap'
-      institute_dir = 'idiap'
-    elif institute == 1:
-      institute = 'manchester'
-      institute_dir = 'uman'
-    elif institute == 2:
-      institute = 'surrey'
-      institute_dir = 'unis'
-    elif institute == 3:
-      institute = 'oulu'
-      institute_dir = 'uoulu'
-    elif institute == 4:
-      institute = 'brno'
-      institute_dir = 'but'
-    elif institute == 5:
-      institute = 'avignon'
-      institute_dir = 'lia'
-    if institute_dir != location:
-      error_msg = "File: %s -- Find location %s in directory of location %s!" % (full_bname, location, institute_dir)
-      raise RuntimeError(error_msg)
-    client_id = v[0][1:4]
-    if v[0][0:4] != client_id_dir:
-      error_msg = "File: %s -- Find identity %s in directory of identity %s!" % (full_bname, v[0][0:4], client_id)
-      raise RuntimeError(error_msg)
-    if not (client_id in client_dict):
-      if (institute == 'surrey' or institute == 'avignon'):
-        group = 'world'
-      elif (institute == 'manchester' or institute == 'oulu'):
-        group = 'dev'
-      elif (institute == 'idiap' or institute == 'brno'):
-        group = 'eval'
-      if verbose>1: print("  Adding client %d..." % int(client_id))
-      session.add(Client(int(client_id), group, gender, institute))
-      client_dict[client_id] = True
-
-    w = session_device.split('_')
-    session_id_from_dir = int(w[0])
-    device_from_dir = w[1]
-
-    session_id = int(v[1])
-    speech_type = v[2][0]
-    shot_id = v[2][1:3]
-    environment = v[3][0]
-    device = v[3][1]
-    if( device == '0'):
-      device = 'mobile'
-    elif( device == '1'):
-      device = 'laptop'
-    if device != device_from_dir:
-      error_msg = "File: %s -- Find device %s in directory of device %s!" % (full_bname, device, device_from_dir)
-      raise RuntimeError(error_msg)
-    if session_id != session_id_from_dir:
-      error_msg = "File: %s -- Find session_id %d in directory of session_id %d!" % (full_bname, session_id, session_id_from_dir)
-      raise RuntimeError(error_msg)
-    channel = int(v[4][0])
-
-    if verbose>1: print("    Adding file '%s'..." % full_bname)
-    session.add(File(int(client_id), full_bname, session_id, speech_type, shot_id, environment, device, channel))
-
-  client_dict = {}
-  if verbose: print("Adding clients and files ...")
-  for location in filter(nodot, os.listdir(datadir)):
+def peak_rss():
+  """Returns the peak resident set size of this process in kilobytes, or None if
+  it cannot be determined on this platform"""
+  try:
+    import resource
+  except ImportError:
+    return None
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return rss // 1024 if sys.platform == 'darwin' else rss
+
+class BuildReport(object):
+  """Instrumentation of the database creation.
+
+  For each section (see :py:meth:`section`), the number of calls, the
+  wall-clock time, the number of executed SQL statements and inserted rows,
+  and the peak resident memory at its end are recorded. Sections can be nested,
+  in which case the outer section includes the numbers of the inner ones."""
+
+  def __init__(self):
+    self.statements = 0
+    self.rows = 0
+    self.start = time.time()
+    self.sections = collections.OrderedDict()
+
+  def attach(self, engine):
+    """Counts the SQL statements executed on the given engine"""
+    from sqlalchemy import event
+    event.listen(engine, 'after_cursor_execute', self._count)
+
+  def _count(self, connection, cursor, statement, parameters, context, executemany):
+    self.statements += 1
+    if statement.lstrip()[:6].upper() == 'INSERT' and cursor.rowcount > 0:
+      self.rows += cursor.rowcount
+
+  @contextlib.contextmanager
+  def section(self, name):
+    """Records the numbers of the enclosed block in the section with the given name"""
+    start, statements, rows = time.time(), self.statements, self.rows
+    try:
+      yield
+    finally:
+      section = self.sections.setdefault(name, {'calls': 0, 'seconds': 0., 'statements': 0, 'rows': 0})
+      section['calls'] += 1
+      section['seconds'] += time.time() - start
+      section['statements'] += self.statements - statements
+      section['rows'] += self.rows - rows
+      section['peak_rss_kb'] = peak_rss()
+
+  def as_dict(self):
+    """Returns the report as a dictionary, which can be serialized to JSON"""
+    return {
+      'sections': self.sections,
+      'total': {
+        'seconds': time.time() - self.start,
+        'statements': self.statements,
+        'rows': self.rows,
+        'peak_rss_kb': peak_rss(),
+      },
+    }
+
+  def save(self, filename):
+    """Writes the report to the given JSON file"""
+    import json
+    with open(filename, 'w') as f:
+      json.dump(self.as_dict(), f, indent=2)
+
+def instrumented(name):
+  """Decorator that records the calls of a function taking a session as first
+  argument in the section ``name`` of the :py:class:`BuildReport` stored in
+  ``session.info['report']``, if any"""
+  def decorator(function):
+    @functools.wraps(function)
+    def wrapper(session, *args, **kwargs):
+      report = session.info.get('report')
+      if report is None:
+        return function(session, *args, **kwargs)
+      with report.section(name):
+        return function(session, *args, **kwargs)
+    return wrapper
+  return decorator
+
+class Progress(object):
+  """Rate-limited progress output, printed with a verbosity level of 2 or more
+  instead of a line for each added row"""
+
+  def __init__(self, what, verbose, interval=2.):
+    self.what = what
+    self.verbose = verbose
+    self.interval = interval
+    self.count = 0
+    self.start = self.last = time.time()
+
+  def __call__(self, count=1):
+    self.count += count
+    if self.verbose > 1:
+      now = time.time()
+      if now - self.last >= self.interval:
+        self.last = now
+        print("  ... %d %s (%.1f/s)" % (self.count, self.what, self.count / max(now - self.start, 1e-6)))
+
+def open_manifest(filename, mode='r'):
+  """Opens a manifest file (a list of path stems, one per line) for reading or
+  writing. Manifests may be gzip-compressed: when reading, compression is
+  detected from the file content; when writing, it is enabled for filenames
+  ending with '.gz'."""
+
+  import io, gzip
+  if mode == 'r':
+    with open(filename, 'rb') as f:
+      compressed = f.read(2) == b'\x1f\x8b'
+  else:
+    compressed = filename.endswith('.gz')
+  if compressed:
+    return io.TextIOWrapper(gzip.open(filename, mode + 'b'))
+  return io.open(filename, mode + 't')
+
+def list_datadir(datadir, extensions):
+  """Walks the MOBIO directory structure below ``datadir`` and yields
+  ``(location, client_id_dir, session_device, basename)`` for all files with
+  one of the given extensions. Directories are traversed in sorted order, and
+  files are sorted by their stem, so that the order is the same as for a sorted
+  manifest."""
+
+  for location in sorted(filter(nodot, os.listdir(datadir))):
     location_dir = os.path.join(datadir, location)
     if os.path.isdir(location_dir):
-      for client_id in filter(nodot, os.listdir(location_dir)):
+      for client_id in sorted(filter(nodot, os.listdir(location_dir))):
         client_dir = os.path.join(location_dir, client_id)
         if os.path.isdir(client_dir):
-          for session_device in filter(nodot, os.listdir(client_dir)):
+          for session_device in sorted(filter(nodot, os.listdir(client_dir))):
             session_device_dir = os.path.join(client_dir, session_device)
             if os.path.isdir(session_device_dir):
-              for filename in filter(nodot, os.listdir(session_device_dir)):
+              for filename in sorted(filter(nodot, os.listdir(session_device_dir)), key=lambda f: os.path.splitext(f)[0]):
                 for ext in extensions:
                   if filename.endswith(ext):
-                    add_file(session, datadir, location, client_id, session_device, os.path.basename(filename), verbose)
+                    yield (location, client_id, session_device, os.path.basename(filename))
+
+def list_manifest(manifest):
+  """Reads the path stems from the given manifest file, line by line, and yields
+  ``(location, client_id_dir, session_device, basename)`` for each of them.
+  Empty lines and lines starting with '#' are ignored."""
+
+  with open_manifest(manifest) as f:
+    for line_number, line in enumerate(f, 1):
+      stem = line.strip()
+      if not stem or stem[0] == '#':
+        continue
+      v = stem.split('/')
+      if len(v) != 4:
+        raise RuntimeError("Manifest %s, line %d -- Path stem '%s' does not have the form 'location/client/session_device/basename'!" % (manifest, line_number, stem))
+      yield tuple(v)
+
+def sort_by_directory(entries, source):
+  """Sorts the entries of each client directory, as returned by
+  :py:func:`list_manifest`, without reading all of them into memory, so that
+  they are in the order of :py:func:`list_datadir`. The client directories must
+  be listed in sorted order and each in a single block, as in the manifests
+  written by the 'manifest' command; otherwise, a RuntimeError is raised."""
+
+  current = None
+  block = []
+  for entry in entries:
+    directory = entry[:2]
+    if directory != current:
+      if current is not None and directory < current:
+        raise RuntimeError("Manifest %s -- The client directory '%s' is listed after '%s'; please sort the manifest!" % (source, '/'.join(directory), '/'.join(current)))
+      for e in sorted(block): yield e
+      current = directory
+      block = []
+    block.append(entry)
+  for e in sorted(block): yield e
+
+def _directories_sorted(entries):
+  """Returns whether the client directories of the entries are listed in
+  sorted order, each in a single block"""
+
+  previous = None
+  for entry in entries:
+    if previous is not None and entry[:2] < previous: return False
+    previous = entry[:2]
+  return True
+
+def sorted_manifest(manifest):
+  """Returns the entries of the given manifest file (see
+  :py:func:`list_manifest`) in the order of :py:func:`list_datadir`. The
+  manifest is read twice: if its client directories are sorted, as in the
+  manifests written by the 'manifest' command, the entries are streamed with
+  :py:func:`sort_by_directory`; otherwise, they are read into memory and
+  sorted."""
+
+  if _directories_sorted(list_manifest(manifest)):
+    return sort_by_directory(list_manifest(manifest), manifest)
+  return iter(sorted(list_manifest(manifest)))
+
+def add_file(session, client_dict, location, client_id_dir, session_device, basename):
+  """Parse a single filename and add it to the list.
+     Also add a client entry if not already in the database."""
+  v = os.path.splitext(basename)[0].split('_')
+  bname = os.path.splitext(basename)[0]
+  full_bname = os.path.join(location, client_id_dir, session_device, bname)
+
+  gender = ''
+  if v[0][0] == 'm': gender = 'male'
+  if v[0][0] == 'f': gender = 'female'
+  institute = int(v[0][1])
+  institute_dir = ''
+  if institute == 0:
+    institute = 'idiap'
+    institute_dir = 'idiap'
+  elif institute == 1:
+    institute = 'manchester'
+    institute_dir = 'uman'
+  elif institute == 2:
+    institute = 'surrey'
+    institute_dir = 'unis'
+  elif institute == 3:
+    institute = 'oulu'
+    institute_dir = 'uoulu'
+  elif institute == 4:
+    institute = 'brno'
+    institute_dir = 'but'
+  elif institute == 5:
+    institute = 'avignon'
+    institute_dir = 'lia'
+  if institute_dir != location:
+    error_msg = "File: %s -- Find location %s in directory of location %s!" % (full_bname, location, institute_dir)
+    raise RuntimeError(error_msg)
+  client_id = v[0][1:4]
+  if v[0][0:4] != client_id_dir:
+    error_msg = "File: %s -- Find identity %s in directory of identity %s!" % (full_bname, v[0][0:4], client_id)
+    raise RuntimeError(error_msg)
+  if not (client_id in client_dict):
+    if (institute == 'surrey' or institute == 'avignon'):
+      group = 'world'
+    elif (institute == 'manchester' or institute == 'oulu'):
+      group = 'dev'
+    elif (institute == 'idiap' or institute == 'brno'):
+      group = 'eval'
+    session.add(Client(int(client_id), group, gender, institute))
+    client_dict[client_id] = True
 
+  w = session_device.split('_')
+  session_id_from_dir = int(w[0])
+  device_from_dir = w[1]
+
+  session_id = int(v[1])
+  speech_type = v[2][0]
+  shot_id = v[2][1:3]
+  environment = v[3][0]
+  device = v[3][1]
+  if( device == '0'):
+    device = 'mobile'
+  elif( device == '1'):
+    device = 'laptop'
+  if device != device_from_dir:
+    error_msg = "File: %s -- Find device %s in directory of device %s!" % (full_bname, device, device_from_dir)
+    raise RuntimeError(error_msg)
+  if session_id != session_id_from_dir:
+    error_msg = "File: %s -- Find session_id %d in directory of session_id %d!" % (full_bname, session_id, session_id_from_dir)
+    raise RuntimeError(error_msg)
+  channel = int(v[4][0])
+
+  session.add(File(int(client_id), full_bname, session_id, speech_type, shot_id, environment, device, channel))
+
+@instrumented('files')
+def add_files(session, entries, verbose, done=()):
+  """Add files to the MOBIO database.
+
+  ``entries`` is an iterable of ``(location, client_id_dir, session_device,
+  basename)`` tuples, as returned by :py:func:`list_datadir` or
+  :py:func:`list_manifest`. After each client directory, the added files are
+  committed and the directory is recorded in the build state, so that it can be
+  skipped when resuming the build; entries of the directories listed in
+  ``done`` are skipped."""
+
+  def checkpoint(directory):
+    session.add(BuildState('files', directory))
+    session.commit()
+
+  # clients that have been added by a previous (interrupted) build
+  client_dict = dict(('%03d' % c.id, True) for c in session.query(Client))
+  if verbose: print("Adding clients and files ...")
+  progress = Progress('files added', verbose)
+  current = None
+  for location, client_id, session_device, basename in entries:
+    directory = location + '/' + client_id
+    if directory in done:
+      continue
+    if directory != current:
+      if current is not None: checkpoint(current)
+      current = directory
+    add_file(session, client_dict, location, client_id, session_device, basename)
+    progress()
+  if current is not None: checkpoint(current)
+
+@instrumented('subworlds')
 def add_subworlds(session, verbose):
   """Adds subworlds"""
 
@@ -539,6 +750,7 @@ def add_subworlds(session, verbose):
                     228, 501, 503, 504, 514, 516, 517, 518, 520, 521,
                     522, 524, 526, 527]
   slists = [onethird_list, twothirds_list, twothirds_list]
+  progress = Progress('files added to subworlds', verbose)
   for k in range(len(snames)):
     if verbose: print("Adding subworld '%s'..." %(snames[k], ))
     su = Subworld(snames[k])
@@ -549,25 +761,24 @@ def add_subworlds(session, verbose):
     if k != 2: # Not twothirds-subsampled
       # Add clients
       for c_id in l:
-        if verbose>1: print("  Adding client '%d' to subworld '%s'..." %(c_id, snames[k]))
         su.clients.append(session.query(Client).filter(Client.id == c_id).first())
         # Add all files from this client
-        q = session.query(File).join(Client).filter(Client.id == c_id)
+        q = session.query(File).join(Client).filter(Client.id == c_id).order_by(File.id)
         for c_file in q:
-          if verbose>1: print("    Adding file '%s' to subworld '%s'..." %(c_file.path, snames[k]))
           su.files.append(c_file)
+          progress()
     else: # twothirds-subsampled: Files were randomly selected from twothirds
       # Add clients
       for c_id in l:
-        if verbose>1: print("  Adding client '%d' to subworld '%s'..." %(c_id, snames[k]))
         su.clients.append(session.query(Client).filter(Client.id == c_id).first())
       # Add subsampled files only
       for path in twothirds_subsampled_filelist:
         q = session.query(File).filter(File.path == path)
         for c_file in q:
-          if verbose>1: print("  Adding file '%s' to subworld '%s'..." %(c_file.path, snames[k]))
           su.files.append(c_file)
+          progress()
 
+@instrumented('tmodels')
 def add_tmodels(session, protocol_id, mobile_only, speech_type, verbose):
   """Adds T-Norm models"""
 
@@ -625,6 +836,7 @@ def add_tmodels(session, protocol_id, mobile_only, speech_type, verbose):
                   (527, ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10', '11', '12'])]
 
   if verbose: print("Adding T-Norm models...")
+  progress = Progress('files added to T-Norm models', verbose)
   strategies = {}
   # Strategies are defined as a list [use_all_sessions, conditions_list, per_session]
   per_session = True
@@ -643,7 +855,6 @@ def add_tmodels(session, protocol_id, mobile_only, speech_type, verbose):
       for sid in slist:
         tmodel_name = str(cid) + '_' + sid + '_' + device_type
         tmodel = TModel(tmodel_name, cid, protocol_id)
-        if verbose>1: print("  Adding T-norm model ('%s')..." % tmodel_name)
         session.add(tmodel)
         session.flush()
         session.refresh(tmodel)
@@ -651,16 +862,18 @@ def add_tmodels(session, protocol_id, mobile_only, speech_type, verbose):
               filter(and_(Client.id == cid, File.session_id == int(sid), File.speech_type.in_(speech_type), File.device.in_(device_types))).\
               order_by(File.id)
         for k in q:
-          if verbose>1: print("    Adding T-norm file '%s' to model '%s'..." % (k.path, tmodel_name))
           tmodel.files.append(k)
+          progress()
 
 
+@instrumented('protocols')
 def add_protocols(session, verbose):
   """Adds protocols"""
 
   # 1. DEFINITIONS
   # Numbers in the lists correspond to session identifiers
-  protocol_definitions = {}
+  # (ordered, so that the protocols always get the same ids)
+  protocol_definitions = collections.OrderedDict()
 
   # Split male and female clients: list of (client_id, first_session_id) # few exceptions with 2 as first session
   clients_male = [(  1,1), (  2,1), (  4,1), (  8,1), ( 11,1), ( 12,1), ( 15,1), ( 16,1), ( 17,1), ( 19,2),
@@ -693,6 +906,7 @@ def add_protocols(session, verbose):
 
   # 2. ADDITIONS TO THE SQL DATABASE
   protocolPurpose_list = [('world', 'train'), ('dev', 'enroll'), ('dev', 'probe'), ('eval', 'enroll'), ('eval', 'probe')]
+  progress = Progress('files added to protocol purposes', verbose)
   for proto in protocol_definitions:
     p = Protocol(proto, protocol_definitions[proto][4])
     # Add protocol
@@ -705,7 +919,6 @@ def add_protocols(session, verbose):
     for key in range(len(protocolPurpose_list)):
       purpose = protocolPurpose_list[key]
       pu = ProtocolPurpose(p.id, purpose[0], purpose[1])
-      if verbose>1: print("  Adding protocol purpose ('%s','%s')..." % (purpose[0], purpose[1]))
       session.add(pu)
       session.flush()
       session.refresh(pu)
@@ -739,8 +952,8 @@ def add_protocols(session, verbose):
         if device_list:
           q = q.filter(File.device.in_(device_list))
         for k in q:
-          if verbose>1: print("    Adding protocol file '%s'..." % (k.path))
           pu.files.append(k)
+          progress()
       # Dev/eval set
       else:
         for client in protocol_definitions[proto][0]:
@@ -756,8 +969,8 @@ def add_protocols(session, verbose):
             q = q.filter(File.speech_type.in_(speech_list))
           q = q.order_by(File.id)
           for k in q:
-            if verbose>1: print("    Adding protocol file '%s'..." % (k.path))
             pu.files.append(k)
+            progress()
 
     # Add protocol
     speech_type = ['p','l','r','f']
@@ -778,6 +991,87 @@ def create_tables(args):
 # Driver API
 # ==========
 
+def run_phase(session, phase, function, resume, verbose=0, tables=()):
+  """Runs a single phase of the database creation and commits its results.
+
+  The completion of the phase is recorded in the build state. If ``resume`` is
+  set, phases that have been completed by a previous build are skipped. If
+  ``verbose`` is set, the rows added to the given ``tables``, i.e., the ones
+  the phase writes to, are reported."""
+
+  from sqlalchemy import func
+
+  def count_rows():
+    return dict((table.name, session.query(func.count()).select_from(table).scalar()) for table in tables)
+
+  if resume and session.query(BuildState).filter(and_(BuildState.phase == phase, BuildState.item == None)).count():
+    if verbose: print("Skipping phase '%s', which has been completed by a previous build" % phase)
+    return
+
+  # the rows are only counted if they are reported
+  if verbose: before = count_rows()
+  start = time.time()
+  function()
+  session.add(BuildState(phase))
+  session.commit()
+  if verbose:
+    elapsed = max(time.time() - start, 1e-6)
+    after = count_rows()
+    files = after.get(File.__tablename__, 0) - before.get(File.__tablename__, 0)
+    rows = sum(after.values()) - sum(before.values())
+    print("Phase '%s' done: %d files and %d rows in %.2f s (%.1f files/s, %.1f rows/s)" % (phase, files, rows, elapsed, files / elapsed, rows / elapsed))
+
+def cluster_files(connection):
+  """Renumbers the files in the order used by the queries, i.e., sorted by
+  client, session, speech type, shot and device, so that files that are read
+  together are stored next to each other after the database is vacuumed.
+  Please note that this changes the file ids."""
+
+  connection.execute('BEGIN')
+  connection.execute('CREATE TEMP TABLE file_order (new_id INTEGER PRIMARY KEY, old_id INTEGER UNIQUE)')
+  connection.execute('INSERT INTO file_order (old_id) SELECT id FROM file ORDER BY client_id, session_id, speech_type, shot_id, device, id')
+  # two passes, to avoid clashes between old and new ids
+  connection.execute('UPDATE file SET id = -(SELECT new_id FROM file_order WHERE old_id = file.id)')
+  connection.execute('UPDATE file SET id = -id')
+  for table in ('subworld_file_association', 'tmodel_file_association', 'protocolPurpose_file_association'):
+    connection.execute('UPDATE "%s" SET file_id = (SELECT new_id FROM file_order WHERE old_id = "%s".file_id)' % (table, table))
+  connection.execute('DROP TABLE file_order')
+  connection.execute('COMMIT')
+
+def finalize(dbfile, page_size=None, cluster=False, verbose=0):
+  """Finalizes the database file: optionally stores the files in clustered
+  order (see :py:func:`cluster_files`) and changes the page size, then
+  rebuilds the file without fragmentation (VACUUM) and collects the
+  statistics used by the query planner (ANALYZE)."""
+
+  import sqlite3
+  connection = sqlite3.connect(dbfile)
+  # VACUUM cannot be run inside a transaction, so we handle them explicitly
+  connection.isolation_level = None
+  try:
+    if cluster:
+      if verbose: print("Storing files in clustered order...")
+      cluster_files(connection)
+    if page_size:
+      if verbose: print("Setting page size to %d bytes..." % page_size)
+      connection.execute('PRAGMA page_size = %d' % page_size)
+    if verbose: print("Compacting the database file...")
+    connection.execute('VACUUM')
+    if verbose: print("Collecting statistics for the query planner...")
+    connection.execute('ANALYZE')
+  finally:
+    connection.close()
+
+def add_fingerprint(session, verbose):
+  """Computes the fingerprint of the database content and stores it in the
+  metadata table"""
+
+  value = content_fingerprint(session)
+  if verbose: print("Storing the fingerprint '%s' of the database content..." % value)
+  session.query(Metadata).filter(Metadata.name == 'fingerprint').delete()
+  session.add(Metadata('fingerprint', value))
+  session.commit()
+
 def create(args):
   """Creates or re-creates this database"""
 
@@ -796,12 +1090,49 @@ def create(args):
   # the real work...
   create_tables(args)
   s = session_try_nolock(args.type, args.files[0], echo=(args.verbose > 2))
-  add_files(s, args.datadir, args.extensions, args.verbose)
-  add_subworlds(s, args.verbose)
-  add_protocols(s, args.verbose)
-  s.commit()
+  report = BuildReport()
+  report.attach(s.get_bind())
+  s.info['report'] = report
+  if args.manifest:
+    # the entries are sorted to obtain the same file ids as when walking the data directory
+    entries = sorted_manifest(args.manifest)
+  else:
+    entries = list_datadir(args.datadir, args.extensions)
+
+  done = set()
+  if args.resume:
+    done = set(k.item for k in s.query(BuildState).filter(and_(BuildState.phase == 'files', BuildState.item != None)))
+    if done and args.verbose: print("Resuming the build: skipping %d client directories, which have been added before" % len(done))
+
+  run_phase(s, 'files', lambda: add_files(s, entries, args.verbose, done), args.resume, args.verbose,
+      (Client.__table__, File.__table__))
+  run_phase(s, 'subworlds', lambda: add_subworlds(s, args.verbose), args.resume, args.verbose,
+      (Subworld.__table__, subworld_client_association, subworld_file_association))
+  run_phase(s, 'protocols', lambda: add_protocols(s, args.verbose), args.resume, args.verbose,
+      (Protocol.__table__, ProtocolPurpose.__table__, protocolPurpose_file_association, TModel.__table__, tmodel_file_association))
+  s.close()
+
+  if args.finalize:
+    if args.benchmark:
+      from .benchmark import query_latency, print_latency
+      before = query_latency(dbfile)
+    with report.section('finalize'):
+      finalize(dbfile, args.page_size, args.cluster, args.verbose)
+    if args.benchmark:
+      print("Query latency after finalization:")
+      print_latency(query_latency(dbfile), before)
+
+  # the fingerprint is computed last, since clustering changes the file ids
+  s = session_try_nolock(args.type, args.files[0], echo=(args.verbose > 2))
+  report.attach(s.get_bind())
+  with report.section('fingerprint'):
+    add_fingerprint(s, args.verbose)
   s.close()
 
+  if args.report:
+    report.save(args.report)
+    if args.verbose: print("Wrote build report to '%s'" % args.report)
+
 def add_command(subparsers):
   """Add specific subcommands that the action "create" can use"""
 
@@ -811,4 +1142,11 @@ def add_command(subparsers):
   parser.add_argument('-v', '--verbose', action='count', help="Do SQL operations in a verbose way?")
   parser.add_argument('-D', '--datadir', metavar='DIR', default='/idiap/resource/database/mobio/IMAGES_PNG/', help="Change the relative path to the directory containing the data of the MOBIO database.")
   parser.add_argument('-E', '--extensions', type=str, nargs='+', default=['.png'], help="Change the extension of the MOBIO files used to create the database.")
+  parser.add_argument('--resume', action='store_true', help="If set, an interrupted build of the database is resumed: completed phases and client directories are skipped.")
+  parser.add_argument('-M', '--manifest', metavar='FILE', help="If given, the list of files is read from this manifest (one path stem per line, optionally gzip-compressed) instead of walking the --datadir tree; the path stems may be in any order, but unsorted manifests are read into memory. A manifest can be written from an existing database with the 'manifest' command.")
+  parser.add_argument('--no-finalize', dest='finalize', action='store_false', help="If set, the database file is left as written, i.e., it is neither compacted nor analyzed for the query planner.")
+  parser.add_argument('--page-size', type=int, choices=[512 << k for k in range(8)], help="If given, the page size (in bytes) of the database file is changed during finalization.")
+  parser.add_argument('--cluster', action='store_true', help="If set, the files are renumbered during finalization, so that they are stored in the order used by the queries (client, session, speech type, shot, device). Please note that this changes the file ids.")
+  parser.add_argument('--report', metavar='FILE', help="If given, a JSON report with the time, the number of SQL statements and inserted rows and the peak memory of each step of the creation is written to this file.")
+  parser.add_argument('--benchmark', action='store_true', help="If set, the latency of typical queries is measured before and after finalization.")
   parser.set_defaults(func=create) #action
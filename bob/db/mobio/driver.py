@@ -24,11 +24,92 @@ import sys
 
 from bob.db.base.driver import Interface as BaseInterface
 
+def _database(args):
+  """Returns the database the given command runs on; the ``batch`` command
+  shares a single open database between all of its requests"""
+
+  db = getattr(args, 'db', None)
+  if db is None:
+    from .query import Database
+    db = Database()
+  return db
+
+def _output(args, binary=False):
+  """Returns the stream the given command writes to; if it is a file given
+  with ``--output``, it must be closed by the caller"""
+
+  if args.selftest:
+    from bob.db.base.utils import null
+    return null()
+  if getattr(args, 'output', None):
+    # a large buffer, so that the file is written in big blocks
+    return open(args.output, 'wb' if binary else 'w', 1 << 20)
+  if binary:
+    sys.stdout.flush()
+    return getattr(sys.stdout, 'buffer', sys.stdout)
+  return sys.stdout
+
+# the columns of the File table, in the order they are dumped
+FILE_COLUMNS = ('id', 'client_id', 'path', 'session_id', 'speech_type', 'shot_id', 'environment', 'device', 'channel_id')
+
+def write_files(files, output, format='lines', directory=None, extension=None, ids_only=False, chunk_size=10000):
+  """Writes the given files to the output stream in the given format.
+
+  Keyword parameters:
+
+  format
+    One of 'lines' (one path per line), 'csv' (all columns of the File table,
+    with a header), 'jsonl' (one JSON object per line) and 'npy' (a numpy array
+    of the file ids; ``output`` must be a binary stream).
+
+  directory, extension
+    Prepended and appended to the path of each file.
+
+  ids_only
+    If set, only the file ids are written, and no path is constructed.
+
+  chunk_size
+    The text formats are written in chunks of this number of lines.
+  """
+
+  if format == 'npy':
+    import numpy
+    numpy.save(output, numpy.array([f.id for f in files], dtype=numpy.int64))
+    return
+
+  columns = ('id',) if ids_only else FILE_COLUMNS
+  def values(f):
+    v = [getattr(f, c) for c in columns]
+    if not ids_only: v[2] = f.make_path(directory, extension)
+    return v
+
+  if format == 'lines':
+    if ids_only: lines = ('%d\n' % f.id for f in files)
+    else: lines = ('%s\n' % f.make_path(directory, extension) for f in files)
+  elif format == 'csv':
+    import csv
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(columns)
+    writer.writerows(values(f) for f in files)
+    return
+  elif format == 'jsonl':
+    import json
+    lines = ('%s\n' % json.dumps(dict(zip(columns, values(f))), sort_keys=True) for f in files)
+  else:
+    raise ValueError("The format '%s' is not known; choose one of 'lines', 'csv', 'jsonl' or 'npy'." % format)
+
+  chunk = []
+  for line in lines:
+    chunk.append(line)
+    if len(chunk) == chunk_size:
+      output.write(''.join(chunk))
+      chunk = []
+  if chunk: output.write(''.join(chunk))
+
 def dumplist(args):
   """Dumps lists of files based on your criteria"""
 
-  from .query import Database
-  db = Database()
+  db = _database(args)
 
   r = db.objects(
       protocol=args.protocol,
@@ -38,60 +119,111 @@ def dumplist(args):
       classes=args.sclass
   )
 
-  output = sys.stdout
-  if args.selftest:
-    from bob.db.base.utils import null
-    output = null()
-
-  for f in r:
-    output.write('%s\n' % (f.make_path(args.directory, args.extension),))
+  output = _output(args, args.format == 'npy')
+  try:
+    write_files(r, output, args.format, args.directory, args.extension, args.ids_only)
+  finally:
+    if args.output and not args.selftest:
+      output.close()
 
   return 0
 
 def checkfiles(args):
   """Checks existence of files based on your criteria"""
 
+  import time
   from .query import Database
+  from .filesystem import check_files, StatCache
   db = Database()
 
   r = db.objects()
 
-  # go through all files, check if they are available on the filesystem
-  good = []
-  bad = []
-  for f in r:
-    if os.path.exists(f.make_path(args.directory, args.extension)):
-      good.append(f)
-    else:
-      bad.append(f)
-
   # report
   output = sys.stdout
   if args.selftest:
     from bob.db.base.utils import null
     output = null()
 
+  last = [0.]
+  def progress(done, total):
+    now = time.time()
+    if args.verbose and (now - last[0] >= 2. or done == total):
+      last[0] = now
+      sys.stderr.write('Listed %d of %d directories\n' % (done, total))
+
+  # go through all files, check if they are available on the filesystem
+  start = time.time()
+  cache = StatCache(args.cache, args.directory, args.extension) if args.cache else None
+  good, bad, missing = check_files(r, args.directory, args.extension, args.jobs, progress, cache, args.full)
+  if cache is not None: cache.save()
+
   if bad:
     for f in bad:
       output.write('Cannot find file "%s"\n' % (f.make_path(args.directory, args.extension),))
     output.write('%d files (out of %d) were not found at "%s"\n' % \
       (len(bad), len(r), args.directory))
+  if args.verbose:
+    for d in missing:
+      output.write('Missing directory "%s"\n' % d)
+  output.write('Checked %d files in %.2f s: %d found, %d missing, %d missing directories\n' % \
+      (len(r), time.time() - start, len(good), len(bad), len(missing)))
 
   return 0
 
-def reverse(args):
-  """Returns a list of file database identifiers given the path stems"""
+def verify(args):
+  """Verifies the contents of the files against a checksum index"""
 
+  import time
   from .query import Database
+  from .filesystem import verify_files, ChecksumIndex
   db = Database()
 
+  r = db.objects()
+
   output = sys.stdout
   if args.selftest:
     from bob.db.base.utils import null
     output = null()
+    r = r[:10]
+
+  start = time.time()
+  last = [0.]
+  def progress(done, total, size):
+    now = time.time()
+    if args.verbose and (now - last[0] >= 2. or done == total):
+      last[0] = now
+      sys.stderr.write('Hashed %d of %d files (%.1f MB/s)\n' % (done, total, size / 1e6 / max(now - start, 1e-9)))
+
+  index = ChecksumIndex(args.index, args.directory, args.extension) if args.index else None
+  result = verify_files(r, args.directory, args.extension, args.jobs, progress, index, args.update or (index is not None and not index.files))
+  if index is not None and not args.selftest: index.save()
+  elapsed = time.time() - start
+
+  for f in result['missing']:
+    output.write('Cannot read file "%s"\n' % (f.make_path(args.directory, args.extension),))
+  for f in result['changed']:
+    output.write('Changed file "%s"\n' % (f.make_path(args.directory, args.extension),))
+  if args.verbose:
+    for f in result['new']:
+      output.write('New file "%s"\n' % (f.make_path(args.directory, args.extension),))
+  output.write('Verified %d files (%.1f MB) in %.2f s (%.1f MB/s with %d jobs): %d unchanged, %d changed, %d missing, %d new\n' % \
+      (len(r), result['bytes'] / 1e6, elapsed, result['bytes'] / 1e6 / max(elapsed, 1e-9), args.jobs,
+       len(result['good']), len(result['changed']), len(result['missing']), len(result['new'])))
 
-  r = db.reverse(args.path)
-  for f in r: output.write('%d\n' % f.id)
+  return 0
+
+def reverse(args):
+  """Returns a list of file database identifiers given the path stems"""
+
+  db = _database(args)
+
+  output = _output(args)
+  try:
+    r = db.reverse(args.path)
+    for f in r: output.write('%d\n' % f.id)
+  finally:
+    if args.output and not args.selftest:
+      output.close()
 
   if not r: return 1
 
@@ -100,18 +232,227 @@ def reverse(args):
 def path(args):
   """Returns a list of fully formed paths or stems given some file id"""
 
+  db = _database(args)
+
+  output = _output(args)
+  try:
+    r = db.paths(args.id, prefix=args.directory, suffix=args.extension)
+    for path in r: output.write('%s\n' % path)
+  finally:
+    if args.output and not args.selftest:
+      output.close()
+
+  if not r: return 1
+
+  return 0
+
+def stats(args):
+  """Counts the files grouped by your criteria"""
+
+  db = _database(args)
+
+  output = _output(args)
+  try:
+    r = db.stats(protocol=args.protocol, groups=args.group, purposes=args.purpose, by=args.by, gender=args.gender, device=args.device)
+    output.write('\t'.join(list(args.by) + ['count']) + '\n')
+    for key, count in r.items():
+      if len(args.by) == 1: key = (key,)
+      output.write('\t'.join([str(k) for k in key] + [str(count)]) + '\n')
+  finally:
+    if args.output and not args.selftest:
+      output.close()
+
+  return 0
+
+def schedule(args):
+  """Distributes the files over jobs of balanced cost, writing one list per job"""
+
+  from .scheduler import estimate_costs, schedule as schedule_files
+  db = _database(args)
+
+  r = db.objects(protocol=args.protocol, purposes=args.purpose, groups=args.group)
+  costs = estimate_costs(r, args.cost, args.directory, args.extension, args.table)
+  shards, loads = schedule_files(r, args.shards, costs)
+
+  output = sys.stdout
+  if args.selftest:
+    from bob.db.base.utils import null
+    output = null()
+  elif args.output and not os.path.exists(args.output):
+    os.makedirs(args.output)
+
+  for i, (shard, load) in enumerate(zip(shards, loads)):
+    if args.output and not args.selftest:
+      with open(os.path.join(args.output, 'shard_%03d.lst' % i), 'w', 1 << 20) as f:
+        write_files(shard, f, 'lines', args.directory, args.extension)
+    output.write('shard %d: %d files, cost %g\n' % (i, len(shard), load))
+  mean = sum(loads) / len(loads)
+  output.write('Scheduled %d files on %d shards, imbalance (maximum / mean cost) %.3f\n' % (len(r), len(shards), max(loads) / mean if mean else 1.))
+
+  return 0
+
+def manifest(args):
+  """Writes the path stems of all files in the database to a manifest"""
+
   from .query import Database
+  from .models import File
+  from .create import open_manifest
   db = Database()
 
+  if args.selftest:
+    from bob.db.base.utils import null
+    output = null()
+  elif args.output:
+    output = open_manifest(args.output, 'w')
+  else:
+    output = sys.stdout
+
+  for (stem,) in db.query(File.path).order_by(File.path):
+    output.write(u'%s\n' % stem)
+
+  if args.output and not args.selftest:
+    output.close()
+
+  return 0
+
+def export(args):
+  """Exports all tables of the database to a columnar bundle"""
+
+  import time
+  from .export import export as export_tables
+
   output = sys.stdout
   if args.selftest:
     from bob.db.base.utils import null
     output = null()
 
-  r = db.paths(args.id, prefix=args.directory, suffix=args.extension)
-  for path in r: output.write('%s\n' % path)
+  start = time.time()
+  rows = export_tables(args.output, args.format, _database(args))
+  output.write('Exported %d rows to "%s" in %.2f s\n' % (rows, args.output, time.time() - start))
 
-  if not r: return 1
+  return 0
+
+# the options of the commands that can be run by "batch", with their defaults
+BATCH_COMMANDS = {
+  'dumplist': {'directory': None, 'extension': None, 'protocol': None, 'purpose': None, 'client': None, 'group': None, 'sclass': None, 'format': 'lines', 'ids_only': False},
+  'path': {'id': None, 'directory': None, 'extension': None},
+  'reverse': {'path': None},
+}
+
+def read_batch(filename):
+  """Reads the requests of a batch specification, which is either a file with
+  one JSON object per line, or (if the file name ends with '.yaml' or '.yml')
+  a YAML list of such objects"""
+
+  if os.path.splitext(filename)[1] in ('.yaml', '.yml'):
+    import yaml
+    with open(filename) as f:
+      return yaml.safe_load(f) or []
+  import json
+  requests = []
+  with open(filename) as f:
+    for line in f:
+      line = line.strip()
+      if line and not line.startswith('#'):
+        requests.append(json.loads(line))
+  return requests
+
+def batch(args):
+  """Runs many dumplist, path and reverse requests on a single open database"""
+
+  import time
+  import argparse
+  from .query import Database
+  db = Database()
+
+  output = sys.stdout
+  if args.selftest:
+    from bob.db.base.utils import null
+    output = null()
+
+  functions = {'dumplist': dumplist, 'path': path, 'reverse': reverse}
+  requests = read_batch(args.spec)
+
+  # validate all requests before running any of them
+  namespaces = []
+  for i, request in enumerate(requests):
+    request = dict(request)
+    command = request.pop('command', None)
+    if command not in BATCH_COMMANDS:
+      raise ValueError("Request %d of '%s' has an unknown command '%s'; choose one of %s." % (i+1, args.spec, command, sorted(BATCH_COMMANDS)))
+    if 'output' not in request:
+      raise ValueError("Request %d of '%s' has no 'output' file." % (i+1, args.spec))
+    if 'class' in request: request['sclass'] = request.pop('class')
+    if 'ids-only' in request: request['ids_only'] = request.pop('ids-only')
+    options = dict(BATCH_COMMANDS[command])
+    unknown = set(request) - set(options) - set(('output',))
+    if unknown:
+      raise ValueError("Request %d of '%s' has unknown options %s for the '%s' command." % (i+1, args.spec, sorted(unknown), command))
+    options.update(request)
+    for key in ('id', 'path'):
+      if key in options and not isinstance(options[key], (list, tuple)):
+        options[key] = [options[key]]
+    if args.directory: options['output'] = os.path.join(args.directory, options['output'])
+    namespaces.append((command, argparse.Namespace(db=db, selftest=args.selftest, **options)))
+
+  failed = 0
+  start = time.time()
+  for command, namespace in namespaces:
+    if namespace.output and not args.selftest:
+      parent = os.path.dirname(namespace.output)
+      if parent and not os.path.exists(parent): os.makedirs(parent)
+    t = time.time()
+    status = functions[command](namespace)
+    if status: failed += 1
+    output.write('%s -> %s%s in %.3f s\n' % (command, namespace.output, ' (failed)' if status else '', time.time() - t))
+  output.write('Ran %d requests in %.2f s, %d failed\n' % (len(namespaces), time.time() - start, failed))
+
+  return 1 if failed else 0
+
+def serve(args):
+  """Runs a local server answering queries to the database"""
+
+  from .server import make_server, RemoteDatabase
+  address = ('127.0.0.1', args.port) if args.port else args.socket
+  if args.selftest and not args.port:
+    # a private socket, so that a running server is not disturbed
+    import tempfile
+    directory = tempfile.mkdtemp()
+    address = os.path.join(directory, 'mobio.sock')
+
+  output = sys.stdout
+  if args.selftest:
+    from bob.db.base.utils import null
+    output = null()
+
+  server = make_server(address, args.cache_size)
+  output.write('Serving the MOBIO database on %s\n' % (address if args.port else "unix socket '%s'" % address,))
+  output.flush()
+
+  if args.selftest:
+    import threading
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+      client = RemoteDatabase(address)
+      client.protocol_names()
+      client.close()
+    finally:
+      server.shutdown()
+      thread.join()
+      server.server_close()
+      if not args.port:
+        os.remove(address)
+        os.rmdir(directory)
+    return 0
+
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    if not args.port and os.path.exists(address): os.remove(address)
 
   return 0
 
@@ -158,6 +499,9 @@ class Interface(BaseInterface):
     parser.add_argument('-C', '--client', type=int, help="if given, limits the dump to a particular client.", choices=db.model_ids() if db.is_valid() else ())
     parser.add_argument('-g', '--group', help="if given, this value will limit the output files to those belonging to a particular protocolar group.", choices=db.groups() if db.is_valid() else ())
     parser.add_argument('-c', '--class', dest="sclass", help="if given, this value will limit the output files to those belonging to the given classes.", choices=('client', 'impostor'))
+    parser.add_argument('-o', '--output', metavar='FILE', help="if given, the list is written to this file instead of the standard output.")
+    parser.add_argument('-f', '--format', default='lines', choices=('lines', 'csv', 'jsonl', 'npy'), help="the output format: one path per line, CSV or JSON lines with all columns of the file table (the path includes --directory and --extension), or a numpy array of the file ids.")
+    parser.add_argument('-i', '--ids-only', action='store_true', help="if set, only the file ids are written, without constructing the paths.")
     parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
     parser.set_defaults(func=dumplist) #action
 
@@ -165,20 +509,95 @@ class Interface(BaseInterface):
     parser = subparsers.add_parser('checkfiles', help=checkfiles.__doc__)
     parser.add_argument('-d', '--directory', help="if given, this path will be prepended to every entry returned.")
     parser.add_argument('-e', '--extension', help="if given, this extension will be appended to every entry returned.")
+    parser.add_argument('-j', '--jobs', type=int, default=8, help="the number of directories that are listed in parallel.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="if set, the progress is reported on the standard error, and missing directories are listed.")
+    parser.add_argument('--cache', metavar='FILE', help="if given, the modification times of the directories and the paths of the existing files are stored in this file, and only directories that have been modified since the last check are listed again.")
+    parser.add_argument('--full', action='store_true', help="if set, all directories are listed again, even if they are unchanged according to the --cache.")
     parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
     parser.set_defaults(func=checkfiles) #action
 
+    # the "verify" action
+    parser = subparsers.add_parser('verify', help=verify.__doc__)
+    parser.add_argument('-d', '--directory', help="if given, this path will be prepended to every entry returned.")
+    parser.add_argument('-e', '--extension', help="if given, this extension will be appended to every entry returned.")
+    parser.add_argument('-j', '--jobs', type=int, default=4, help="the number of processes that read and hash files in parallel.")
+    parser.add_argument('-i', '--index', metavar='FILE', help="the checksum index to compare with; it is created with the digests of all files if it does not exist yet.")
+    parser.add_argument('-u', '--update', action='store_true', help="if set, the digests of new and changed files are stored in the --index.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="if set, the progress is reported on the standard error, and files that are not in the index are listed.")
+    parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
+    parser.set_defaults(func=verify) #action
+
     # adds the "reverse" command
     parser = subparsers.add_parser('reverse', help=reverse.__doc__)
+    parser.add_argument('-o', '--output', metavar='FILE', help="if given, the result is written to this file instead of the standard output.")
     parser.add_argument('path', nargs='+', help="one or more path stems to look up. If you provide more than one, files which cannot be reversed will be omitted from the output.")
     parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
     parser.set_defaults(func=reverse) #action
 
     # adds the "path" command
     parser = subparsers.add_parser('path', help=path.__doc__)
+    parser.add_argument('-o', '--output', metavar='FILE', help="if given, the result is written to this file instead of the standard output.")
     parser.add_argument('-d', '--directory', help="if given, this path will be prepended to every entry returned.")
     parser.add_argument('-e', '--extension', help="if given, this extension will be appended to every entry returned.")
     parser.add_argument('id', nargs='+', type=int, help="one or more file ids to look up. If you provide more than one, files which cannot be found will be omitted from the output. If you provide a single id to lookup, an error message will be printed if the id does not exist in the database. The exit status will be non-zero in such case.")
     parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
     parser.set_defaults(func=path) #action
 
+    # adds the "export" command
+    from .export import FORMATS
+    parser = subparsers.add_parser('export', help=export.__doc__)
+    parser.add_argument('output', help="the file (for the 'npz' format) or directory (for the other formats) to write; read it back with bob.db.mobio.export.load().")
+    parser.add_argument('-f', '--format', default='npz', choices=FORMATS, help="the format of the bundle: a single npz file, a directory of npy files that can be memory-mapped, or a directory with one Arrow IPC or Parquet file per table (requires pyarrow).")
+    parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
+    parser.set_defaults(func=export) #action
+
+    # adds the "batch" command
+    parser = subparsers.add_parser('batch', help=batch.__doc__)
+    parser.add_argument('spec', help="the file describing the requests, one JSON object per line (or a YAML list, if the name ends with '.yaml'), e.g. {\"command\": \"dumplist\", \"protocol\": \"mobile0-male\", \"group\": \"dev\", \"output\": \"dev.lst\"}. The keys are the long option names of the 'dumplist', 'path' and 'reverse' commands; 'output' is required.")
+    parser.add_argument('-d', '--directory', help="if given, the output files of the requests are relative to this directory.")
+    parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
+    parser.set_defaults(func=batch) #action
+
+    # adds the "serve" command
+    import tempfile
+    parser = subparsers.add_parser('serve', help=serve.__doc__)
+    parser.add_argument('-s', '--socket', default=os.path.join(tempfile.gettempdir(), 'bob.db.mobio.sock'), help="the Unix domain socket the server listens to; connect to it with bob.db.mobio.server.RemoteDatabase(socket).")
+    parser.add_argument('-p', '--port', type=int, help="if given, the server listens to this TCP port of the local host instead of a Unix domain socket.")
+    parser.add_argument('-c', '--cache-size', type=int, default=1024, help="the number of responses kept in the cache of the server.")
+    parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
+    parser.set_defaults(func=serve) #action
+
+    # adds the "stats" command
+    from .query import STATS_COLUMNS
+    parser = subparsers.add_parser('stats', help=stats.__doc__)
+    parser.add_argument('-b', '--by', nargs='+', default=['client'], choices=sorted(STATS_COLUMNS), help="the keys to group the files by.")
+    parser.add_argument('-p', '--protocol', nargs='+', help="if given, limits the counts to the given protocols.", choices=db.protocol_names() if db.is_valid() else ())
+    parser.add_argument('-g', '--group', nargs='+', help="if given, limits the counts to the given protocolar groups.", choices=db.groups() if db.is_valid() else ())
+    parser.add_argument('-u', '--purpose', nargs='+', help="if given, limits the counts to the given purposes.", choices=db.purposes() if db.is_valid() else ())
+    parser.add_argument('-G', '--gender', help="if given, limits the counts to the clients of the given gender.", choices=db.genders() if db.is_valid() else ())
+    parser.add_argument('-D', '--device', help="if given, limits the counts to the given device.", choices=('mobile', 'laptop'))
+    parser.add_argument('-o', '--output', metavar='FILE', help="if given, the table is written to this file instead of the standard output.")
+    parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
+    parser.set_defaults(func=stats) #action
+
+    # adds the "schedule" command
+    from .scheduler import METHODS
+    parser = subparsers.add_parser('schedule', help=schedule.__doc__)
+    parser.add_argument('-n', '--shards', type=int, default=1, help="the number of jobs the files are distributed over.")
+    parser.add_argument('-p', '--protocol', help="if given, limits the files to the given protocol.", choices=db.protocol_names() if db.is_valid() else ())
+    parser.add_argument('-g', '--group', nargs='+', help="if given, limits the files to the given protocolar groups.", choices=db.groups() if db.is_valid() else ())
+    parser.add_argument('-u', '--purpose', nargs='+', help="if given, limits the files to the given purposes.", choices=db.purposes() if db.is_valid() else ())
+    parser.add_argument('-c', '--cost', default='static', choices=METHODS, help="how the cost of each file is estimated: from its speech type and device, from its size on disk (in --directory, with --extension), or from the --table.")
+    parser.add_argument('-t', '--table', metavar='FILE', help="the cost of the files, one file id or path and its cost per line; used with '--cost table'.")
+    parser.add_argument('-d', '--directory', help="if given, this path will be prepended to every entry returned.")
+    parser.add_argument('-e', '--extension', help="if given, this extension will be appended to every entry returned.")
+    parser.add_argument('-o', '--output', metavar='DIR', help="if given, the list of the files of each job is written to 'shard_NNN.lst' in this directory.")
+    parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
+    parser.set_defaults(func=schedule) #action
+
+    # adds the "manifest" command
+    parser = subparsers.add_parser('manifest', help=manifest.__doc__)
+    parser.add_argument('-o', '--output', metavar='FILE', help="if given, the manifest is written to this file instead of the standard output; it will be gzip-compressed if the name ends with '.gz'. The manifest can be used with 'create --manifest' to rebuild the database without access to the data.")
+    parser.add_argument('--self-test', dest="selftest", action='store_true', help=argparse.SUPPRESS)
+    parser.set_defaults(func=manifest) #action
+
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+#
+# Copyright (C) 2011-2013 Idiap Research Institute, Martigny, Switzerland
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Export of the tables of the MOBIO database to columnar formats.
+
+Each column of each table is converted into a numpy array: integers into
+``int64`` (missing values become -1), strings into fixed-width unicode, and
+enumerations are dictionary-encoded, i.e., stored as ``int8`` codes (-1 for
+missing values) together with the array of their categories. The bundle is
+written as:
+
+npz
+  a single ``.npz`` file, with an entry ``table.column`` for each column and
+  ``table.column.categories`` for the categories of the enumerations
+
+npy
+  a directory with one ``.npy`` file named like the entries of the ``npz``
+  format, which can be memory-mapped
+
+arrow, parquet
+  a directory with one Arrow IPC (``.arrow``, memory-mappable) or Parquet
+  (``.parquet``) file for each table, in which enumerations are dictionary
+  arrays; these formats require pyarrow
+"""
+
+import os
+import numpy
+
+from .models import Base
+
+# the tables that are exported, i.e., all but the ones used while creating the database
+TABLES = ('client', 'file', 'protocol', 'protocolPurpose', 'subworld', 'tmodel',
+    'protocolPurpose_file_association', 'subworld_client_association',
+    'subworld_file_association', 'tmodel_file_association')
+
+FORMATS = ('npz', 'npy', 'arrow', 'parquet')
+
+def _enums(column):
+  """Returns the categories of an enumerated column, or None"""
+  enums = getattr(column.type, 'enums', None)
+  if enums is None: enums = getattr(getattr(column.type, 'impl', None), 'enums', None)
+  return list(enums) if enums is not None else None
+
+def _is_integer(column):
+  import sqlalchemy
+  return isinstance(column.type, sqlalchemy.Integer) or isinstance(getattr(column.type, 'impl', None), sqlalchemy.Integer)
+
+def table_arrays(session, name):
+  """Reads the given table and returns a list of tuples ``(column, values,
+  categories)``, where ``values`` is a numpy array and ``categories`` is None,
+  or the array of the categories for enumerations"""
+
+  table = Base.metadata.tables[name]
+  columns = list(table.columns)
+  order = list(table.primary_key.columns) or columns
+  rows = session.execute(table.select().order_by(*order)).fetchall()
+  values = list(zip(*rows)) if rows else [()] * len(columns)
+
+  result = []
+  for column, data in zip(columns, values):
+    enums = _enums(column)
+    if enums is not None:
+      codes = dict((e, i) for i, e in enumerate(enums))
+      result.append((column.name, numpy.array([codes.get(v, -1) for v in data], dtype=numpy.int8), numpy.array(enums, dtype='U')))
+    elif _is_integer(column):
+      result.append((column.name, numpy.array([-1 if v is None else int(v) for v in data], dtype=numpy.int64), None))
+    else:
+      result.append((column.name, numpy.array([u'' if v is None else v for v in data], dtype='U'), None))
+  return result
+
+def _arrow_table(arrays):
+  import pyarrow
+  names = []
+  columns = []
+  for name, values, categories in arrays:
+    names.append(name)
+    if categories is None:
+      columns.append(pyarrow.array(values))
+    else:
+      columns.append(pyarrow.DictionaryArray.from_arrays(pyarrow.array(values, mask=values < 0), pyarrow.array(categories)))
+  return pyarrow.Table.from_arrays(columns, names=names)
+
+def export(output, format='npz', db=None):
+  """Exports all tables of the database to the given output file (``npz``) or
+  directory (other formats), in one of the :py:data:`FORMATS`. If no ``db`` is
+  given, the default :py:class:`bob.db.mobio.Database` is exported.
+
+  Returns the total number of exported rows."""
+
+  if format not in FORMATS:
+    raise ValueError("The format '%s' is not known; choose one of %s." % (format, ', '.join(FORMATS)))
+  if db is None:
+    from .query import Database
+    db = Database()
+
+  if format != 'npz' and not os.path.exists(output):
+    os.makedirs(output)
+
+  entries = {}
+  rows = 0
+  for name in TABLES:
+    arrays = table_arrays(db.m_session, name)
+    rows += len(arrays[0][1])
+    if format == 'arrow':
+      import pyarrow.ipc
+      table = _arrow_table(arrays)
+      with pyarrow.OSFile(os.path.join(output, name + '.arrow'), 'wb') as sink:
+        writer = pyarrow.ipc.new_file(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+    elif format == 'parquet':
+      import pyarrow.parquet
+      pyarrow.parquet.write_table(_arrow_table(arrays), os.path.join(output, name + '.parquet'))
+    else:
+      for column, values, categories in arrays:
+        entries['%s.%s' % (name, column)] = values
+        if categories is not None: entries['%s.%s.categories' % (name, column)] = categories
+
+  if format == 'npz':
+    # numpy would append '.npz' to a file name without this extension
+    with open(output, 'wb') as f:
+      numpy.savez(f, **entries)
+  elif format == 'npy':
+    for key, values in entries.items():
+      numpy.save(os.path.join(output, key + '.npy'), values)
+  return rows
+
+def load(path, mmap=True):
+  """Loads a bundle written by :py:func:`export`.
+
+  For the ``npz`` and ``npy`` formats, a dictionary mapping each table name to
+  a dictionary of its columns (and their ``.categories``) is returned; the
+  ``npy`` arrays are memory-mapped if ``mmap`` is set. For the ``arrow`` and
+  ``parquet`` formats, a dictionary mapping each table name to a
+  ``pyarrow.Table`` is returned; Arrow IPC files are memory-mapped if
+  ``mmap`` is set."""
+
+  tables = {}
+  def add(key, values):
+    table, column = key.split('.', 1)
+    tables.setdefault(table, {})[column] = values
+
+  if not os.path.isdir(path):
+    with numpy.load(path) as data:
+      for key in data.files: add(key, data[key])
+    return tables
+
+  names = sorted(os.listdir(path))
+  if any(n.endswith('.npy') for n in names):
+    for n in names:
+      if n.endswith('.npy'):
+        add(n[:-4], numpy.load(os.path.join(path, n), mmap_mode='r' if mmap else None))
+  elif any(n.endswith('.arrow') for n in names):
+    import pyarrow.ipc
+    for n in names:
+      if n.endswith('.arrow'):
+        source = pyarrow.memory_map(os.path.join(path, n)) if mmap else pyarrow.OSFile(os.path.join(path, n))
+        tables[n[:-6]] = pyarrow.ipc.open_file(source).read_all()
+  else:
+    import pyarrow.parquet
+    for n in names:
+      if n.endswith('.parquet'):
+        tables[n[:-8]] = pyarrow.parquet.read_table(os.path.join(path, n), memory_map=mmap)
+  return tables
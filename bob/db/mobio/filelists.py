@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+#
+# Copyright (C) 2011-2013 Idiap Research Institute, Martigny, Switzerland
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Readers of the file lists written by :py:mod:`bob.db.mobio.generate_filelist`.
+
+Instead of the expanded ``for_scores.lst``, with one line for each pair of
+probe and model, the compact mode writes for each group the list of models
+(``trials_models.lst``, one model id per line), the list of probes
+(``trials_probes.lst``, the path and the client id of each probe), and,
+if some pairs are not to be scored, the list of these exceptions
+(``trials_exceptions.lst``, the path of the probe and the model id).
+
+The lists are written in one of the :py:data:`FORMATS`: plain text, text
+compressed with gzip (``.lst.gz``) or zstandard (``.lst.zst``, which requires
+the zstandard package), or numpy arrays (``.npz``) with the ``path`` of each
+file, its ``file_id`` and ``client_id`` and, depending on the list, the
+``model_id`` and the ``probe_index`` of each trial in the path table.
+"""
+
+import os
+import numpy
+
+# the names of the files of the compact mode
+MODELS = 'trials_models.lst'
+PROBES = 'trials_probes.lst'
+EXCEPTIONS = 'trials_exceptions.lst'
+
+FORMATS = ('text', 'gz', 'zst', 'npz')
+
+def list_filename(name, format='text'):
+  """Returns the file name of the list with the given (text) name, e.g.
+  'for_models.lst', in the given format"""
+
+  if format == 'npz': return os.path.splitext(name)[0] + '.npz'
+  return name + {'text': '', 'gz': '.gz', 'zst': '.zst'}[format]
+
+def find_list(directory, name):
+  """Returns the file name of the list with the given (text) name in the given
+  directory, in whatever format it was written, or None"""
+
+  for format in FORMATS:
+    filename = os.path.join(directory, list_filename(name, format))
+    if os.path.exists(filename): return filename
+  return None
+
+def open_list(filename, mode='r', compression=None):
+  """Opens a text list for reading ('r') or writing ('w'); the ``compression``
+  ('gz' or 'zst') is determined by the extension of the file name, if not
+  given"""
+
+  import io
+  if compression is None:
+    compression = {'.gz': 'gz', '.zst': 'zst'}.get(os.path.splitext(filename)[1])
+  if compression == 'gz':
+    import gzip
+    return io.TextIOWrapper(gzip.GzipFile(filename, mode + 'b'))
+  if compression == 'zst':
+    import zstandard
+    raw = open(filename, mode + 'b')
+    if mode == 'w':
+      stream = zstandard.ZstdCompressor().stream_writer(raw)
+    else:
+      stream = zstandard.ZstdDecompressor().stream_reader(raw)
+    return io.TextIOWrapper(stream)
+  # a large buffer, so that the lists are read and written in big blocks
+  return open(filename, mode, 1 << 20)
+
+def load_list(filename):
+  """Loads the arrays of a list in the ``npz`` format into a dictionary"""
+
+  with numpy.load(filename) as data:
+    return dict((key, data[key]) for key in data.files)
+
+def _npz_rows(data):
+  # the fields of the lines of the text list corresponding to the arrays
+  def ids(values): return ['%03d' % v for v in values]
+  if 'probe_index' in data:
+    paths, clients, models = data['path'], ids(data['client_id']), ids(data['model_id'])
+    return [(paths[p], models[i], models[i], clients[p]) for i, p in enumerate(data['probe_index'])]
+  if 'path' not in data:
+    return [(m,) for m in ids(data['model_id'])]
+  if 'model_id' in data:
+    return list(zip(data['path'], ids(data['model_id']), ids(data['client_id'])))
+  return list(zip(data['path'], ids(data['client_id'])))
+
+def read_list(filename):
+  """Reads a list in any of the :py:data:`FORMATS`, returning the list of the
+  tuples of the fields (strings) of each line of the corresponding text list"""
+
+  if filename.endswith('.npz'):
+    return [tuple(str(f) for f in row) for row in _npz_rows(load_list(filename))]
+  with open_list(filename) as f:
+    return [tuple(line.split()) for line in f if line.strip()]
+
+def _read(directory, name):
+  filename = find_list(directory, name)
+  if filename is None:
+    raise IOError("The list '%s' was not found in '%s'." % (name, directory))
+  return read_list(filename)
+
+def read_for_scores(filename):
+  """Reads an expanded ``for_scores.lst`` (in any of the :py:data:`FORMATS`),
+  returning the list of tuples ``(probe_path, model_id, claimed_id,
+  probe_client_id)``"""
+
+  return read_list(filename)
+
+def read_trials(directory):
+  """Reads the compact trials of a group directory.
+
+  Returns a tuple ``(models, probes, exceptions)``: the list of model ids, the
+  list of ``(probe_path, probe_client_id)`` and the set of
+  ``(probe_path, model_id)`` pairs that are not to be scored (all fields are
+  strings, as in the expanded lists)."""
+
+  models = [fields[0] for fields in _read(directory, MODELS)]
+  probes = [(fields[0], fields[1]) for fields in _read(directory, PROBES)]
+  exceptions = set()
+  if find_list(directory, EXCEPTIONS) is not None:
+    exceptions = set((fields[0], fields[1]) for fields in _read(directory, EXCEPTIONS))
+  return models, probes, exceptions
+
+def _models_of_shard(models, shard):
+  if shard is None: return models
+  from .sharding import check_shard
+  index, count = check_shard(shard)
+  return models[index::count]
+
+def iter_trials(directory, shard=None):
+  """Yields the compact trials of a group directory as the tuples of
+  :py:func:`read_for_scores`, in the same order, without expanding them in
+  memory. If a ``shard`` ``(index, count)`` is given, only the trials of the
+  models at positions ``index``, ``index + count``, ... are yielded."""
+
+  models, probes, exceptions = read_trials(directory)
+  models = _models_of_shard(models, shard)
+  for path, client_id in probes:
+    for model_id in models:
+      if exceptions and (path, model_id) in exceptions: continue
+      yield path, model_id, model_id, client_id
+
+def trial_indices(directory, shard=None):
+  """Returns the compact trials of a group directory as numpy arrays.
+
+  Returns a tuple ``(models, probes, probe_index, model_index)``: the lists of
+  :py:func:`read_trials`, and two ``int32`` arrays with the index of the probe
+  and of the model of each trial, in the order of :py:func:`iter_trials`.
+  With a ``shard``, only the models of the shard are returned, as in
+  :py:func:`iter_trials`."""
+
+  models, probes, exceptions = read_trials(directory)
+  models = _models_of_shard(models, shard)
+  probe_index = numpy.repeat(numpy.arange(len(probes), dtype=numpy.int32), len(models))
+  model_index = numpy.tile(numpy.arange(len(models), dtype=numpy.int32), len(probes))
+  if exceptions:
+    probe_positions = dict((p[0], i) for i, p in enumerate(probes))
+    model_positions = dict((m, i) for i, m in enumerate(models))
+    excluded = [probe_positions[p] * len(models) + model_positions[m] for p, m in exceptions if p in probe_positions and m in model_positions]
+    keep = numpy.ones(len(probe_index), dtype=bool)
+    keep[excluded] = False
+    probe_index, model_index = probe_index[keep], model_index[keep]
+  return models, probes, probe_index, model_index
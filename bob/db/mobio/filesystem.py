@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+#
+# Copyright (C) 2011-2013 Idiap Research Institute, Martigny, Switzerland
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Checks and verification of the original data files of the MOBIO database on
+the filesystem.
+"""
+
+import os
+import errno
+
+def list_directory(directory):
+  """Returns the set of entries of the given directory, or None if the
+  directory does not exist. Where ``os.scandir`` is available (Python 3.5+),
+  broken symbolic links are left out, as they do not exist according to
+  ``os.path.exists``; with ``os.listdir``, they are included."""
+
+  try:
+    if hasattr(os, 'scandir'):
+      # only symbolic links need another system call
+      return set(e.name for e in os.scandir(directory or os.curdir) if not e.is_symlink() or os.path.exists(e.path))
+    return set(os.listdir(directory or os.curdir))
+  except OSError as e:
+    if e.errno in (errno.ENOENT, errno.ENOTDIR):
+      return None
+    raise
+
+def modification_time(path):
+  """Returns the modification time of the given path, or None if it does not exist"""
+
+  try:
+    return os.stat(path).st_mtime
+  except OSError as e:
+    if e.errno in (errno.ENOENT, errno.ENOTDIR):
+      return None
+    raise
+
+class _Sidecar(object):
+  """Data stored in a JSON sidecar file, which is only valid for the data
+  directory and extension (and the format version) it was created with; it is
+  discarded if they differ"""
+
+  # the names of the dictionaries that are stored
+  FIELDS = ()
+  # the version of the format, which is stored if it is not None
+  VERSION = None
+
+  def __init__(self, filename, directory=None, extension=None):
+    self.filename = filename
+    self.directory = directory
+    self.extension = extension
+    for name in self.FIELDS: setattr(self, name, {})
+    if os.path.exists(filename):
+      import json
+      with open(filename) as f:
+        data = json.load(f)
+      if data.get('directory') == directory and data.get('extension') == extension and data.get('version') == self.VERSION:
+        for name in self.FIELDS: setattr(self, name, data[name])
+
+  def save(self):
+    """Writes the data to its file; the file is replaced atomically"""
+
+    import json
+    data = dict((name, getattr(self, name)) for name in self.FIELDS)
+    data.update(directory=self.directory, extension=self.extension)
+    if self.VERSION is not None: data['version'] = self.VERSION
+    temp = self.filename + '.tmp'
+    with open(temp, 'w') as f:
+      json.dump(data, f, indent=0, sort_keys=True)
+    os.rename(temp, self.filename)
+
+class StatCache(_Sidecar):
+  """Persistent cache for :py:func:`check_files`, stored as a JSON sidecar file.
+
+  For each existing file, its path is stored under its file id, and for each
+  session directory, its modification time. When checking the files again,
+  only directories whose modification time has changed (i.e., in which files
+  were added, removed or renamed) are listed. The cache is only valid for the
+  given data directory and extension; it is discarded if they differ from the
+  ones it was created with.
+
+  The size and modification time of each file are not stored: a file that is
+  rewritten in place does not change the modification time of its directory,
+  and it is not noticed, but it still exists, which is all that
+  :py:func:`check_files` reports. Changes of the contents of the files are
+  found by :py:func:`verify_files` with a :py:class:`ChecksumIndex`.
+  """
+
+  FIELDS = ('directories', 'files')
+  VERSION = 2
+
+def check_files(files, directory=None, extension=None, workers=8, progress=None, cache=None, full=False):
+  """Checks the existence of the given files on the filesystem.
+
+  Instead of testing each file separately, the files are grouped by directory
+  and each directory is listed once, using a pool of threads. Without a cache,
+  the parent directories (i.e., the client directories) are listed first, so
+  that the files of missing session directories are reported without any
+  further system call.
+
+  Keyword parameters:
+
+  files
+    The ``File`` objects to check.
+
+  directory, extension
+    The prefix and suffix used to build the full path of each file.
+
+  workers
+    The number of threads that list directories in parallel.
+
+  progress
+    If given, a function that is called with the number of listed and the total
+    number of session directories, each time a directory has been listed.
+
+  cache
+    If given, a :py:class:`StatCache`. Only the session directories whose
+    modification time differs from the cached one are listed; the paths of
+    their existing files are stored in the cache.
+
+  full
+    If set, all directories are listed, even if they are unchanged according
+    to the ``cache``.
+
+  Returns: a tuple ``(good, bad, missing)`` with the lists of existing and
+  missing files (in the order of ``files``), and the sorted list of missing
+  session directories. Files that are broken symbolic links are missing,
+  except on Python versions without ``os.scandir`` (see
+  :py:func:`list_directory`).
+  """
+
+  from multiprocessing.pool import ThreadPool
+
+  paths = [f.make_path(directory, extension) for f in files]
+  directories = sorted(set(os.path.dirname(p) for p in paths))
+
+  pool = ThreadPool(max(workers, 1))
+  try:
+    if cache is None:
+      parents = sorted(set(os.path.dirname(d) for d in directories))
+      parent_entries = dict(zip(parents, pool.map(list_directory, parents)))
+      missing = set(d for d in directories if parent_entries[os.path.dirname(d)] is None or os.path.basename(d) not in parent_entries[os.path.dirname(d)])
+      to_list = [d for d in directories if d not in missing]
+    else:
+      mtimes = dict(zip(directories, pool.map(modification_time, directories)))
+      missing = set(d for d in directories if mtimes[d] is None)
+      to_list = [d for d in directories if d not in missing and (full or cache.directories.get(d) != mtimes[d])]
+
+    entries = {}
+    for d, names in pool.imap_unordered(lambda d: (d, list_directory(d)), to_list):
+      entries[d] = names
+      if progress is not None: progress(len(entries), len(to_list))
+
+    # directories that vanished in the meantime
+    missing.update(d for d in to_list if entries[d] is None)
+
+    good = []
+    bad = []
+    for f, p in zip(files, paths):
+      d = os.path.dirname(p)
+      if d in entries:
+        exists = entries[d] is not None and os.path.basename(p) in entries[d]
+        if cache is not None:
+          if exists: cache.files[str(f.id)] = p
+          else: cache.files.pop(str(f.id), None)
+      elif d in missing:
+        exists = False
+        if cache is not None: cache.files.pop(str(f.id), None)
+      else:
+        # unchanged directory
+        exists = cache.files.get(str(f.id)) == p
+      (good if exists else bad).append(f)
+
+    if cache is not None:
+      for d in to_list:
+        if entries[d] is None: cache.directories.pop(d, None)
+        else: cache.directories[d] = mtimes[d]
+      for d in missing:
+        cache.directories.pop(d, None)
+  finally:
+    pool.close()
+    pool.join()
+
+  return good, bad, sorted(missing)
+
+def file_digest(path, block_size=1<<20):
+  """Returns a tuple ``(path, size, digest)`` with the size and the SHA-256 hex
+  digest of the contents of the given file, or ``(path, None, None)`` if it
+  cannot be read"""
+
+  import hashlib
+  h = hashlib.sha256()
+  size = 0
+  try:
+    with open(path, 'rb') as f:
+      while True:
+        block = f.read(block_size)
+        if not block: break
+        h.update(block)
+        size += len(block)
+  except (IOError, OSError):
+    return path, None, None
+  return path, size, h.hexdigest()
+
+class ChecksumIndex(_Sidecar):
+  """Index of the sizes and contents digests of the files, stored as a JSON
+  sidecar file.
+
+  For each file, its path, size and SHA-256 digest are stored under its file
+  id. Like the :py:class:`StatCache`, the index is only valid for the given data
+  directory and extension.
+  """
+
+  FIELDS = ('files',)
+
+def verify_files(files, directory=None, extension=None, workers=8, progress=None, index=None, update=False):
+  """Computes the digests of the contents of the given files and compares them
+  to the ones stored in the ``index``.
+
+  The files are read and hashed by a pool of ``workers`` processes, so that the
+  throughput scales with the number of workers until the storage is saturated.
+
+  Keyword parameters:
+
+  files
+    The ``File`` objects to verify.
+
+  directory, extension
+    The prefix and suffix used to build the full path of each file.
+
+  workers
+    The number of processes that read files in parallel.
+
+  progress
+    If given, a function that is called with the number of hashed files, the
+    total number of files and the number of bytes read so far.
+
+  index
+    If given, a :py:class:`ChecksumIndex` to compare with.
+
+  update
+    If set, the digests of new and changed files are stored in the ``index``
+    and the entries of missing files are removed from it.
+
+  Returns: a dictionary with the lists of ``'good'`` (identical to the index),
+  ``'changed'`` (different size or contents), ``'missing'`` (unreadable) and
+  ``'new'`` (not in the index) files, in the order of ``files``, and the total
+  number of ``'bytes'`` read.
+  """
+
+  from multiprocessing import Pool
+
+  paths = [f.make_path(directory, extension) for f in files]
+  digests = {}
+  total = 0
+
+  pool = Pool(max(workers, 1))
+  try:
+    for p, size, digest in pool.imap_unordered(file_digest, paths, chunksize=4):
+      digests[p] = (size, digest)
+      if size is not None: total += size
+      if progress is not None: progress(len(digests), len(paths), total)
+  finally:
+    pool.close()
+    pool.join()
+
+  result = {'good': [], 'changed': [], 'missing': [], 'new': [], 'bytes': total}
+  for f, p in zip(files, paths):
+    size, digest = digests[p]
+    key = str(f.id)
+    known = index.files.get(key) if index is not None else None
+    if size is None:
+      result['missing'].append(f)
+      if update and index is not None: index.files.pop(key, None)
+      continue
+    if known is None or known[0] != p:
+      result['new'].append(f)
+    elif known[1] != size or known[2] != digest:
+      result['changed'].append(f)
+    else:
+      result['good'].append(f)
+      continue
+    if update and index is not None: index.files[key] = [p, size, digest]
+
+  return result
@@ -16,6 +16,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+"""Generates the file lists of a protocol of the MOBIO database, as used by
+the verification tool chains: the world training list, and for the 'dev' and
+'eval' groups the enrollment list of the models and the list of all probe and
+model pairs to be scored."""
+
 import sys, os
 import argparse
 from .query import Database
@@ -24,14 +29,14 @@ from .query import Database
 def sort_by_ids(files):
     """Returns a sorted version of the given list of File's (or other structures that define an 'id' data member).
     The files will be sorted according to their id, and duplicate entries will be removed."""
-    sorted_files = sorted(files, cmp=lambda x,y: cmp(x.id, y.id))
+    sorted_files = sorted(files, key=lambda f: f.id)
     return [f for i,f in enumerate(sorted_files) if not i or sorted_files[i-1].id != f.id]
 
 
 def sort_by_pathes(files):
-    """Returns a sorted version of the given list of File's (or other structures that define an 'id' data member).
-    The files will be sorted according to their id, and duplicate entries will be removed."""
-    sorted_files = sorted(files, cmp=lambda x,y: cmp(x.path, y.path))
+    """Returns a sorted version of the given list of File's (or other structures that define a 'path' data member).
+    The files will be sorted according to their path, and duplicate entries will be removed."""
+    sorted_files = sorted(files, key=lambda f: f.path)
     return [f for i,f in enumerate(sorted_files) if not i or sorted_files[i-1].path != f.path]
 
 def ensure_dir(dirname):
@@ -47,7 +52,240 @@ def ensure_dir(dirname):
     if os.path.isdir(dirname): pass
     else: raise
 
-def main():
+def collect(db, protocol, gender=None):
+  """Queries all files of the given protocol in a single pass.
+
+  Returns a tuple ``(lists, models, file_ids)``: ``lists`` maps each list
+  ('world', 'dev-enroll', 'dev-probe', 'eval-enroll', 'eval-probe') to a list
+  of ``(path, client_id)`` pairs without duplicates, sorted by path;
+  ``models`` maps 'dev' and 'eval' to the sorted list of the model ids of the
+  group, and ``file_ids`` maps each path to the id of its File.
+  """
+
+  from .models import File, Client, ProtocolPurpose, Protocol
+
+  q = db.query(File.id, File.path, File.client_id, Client.sgroup, ProtocolPurpose.sgroup, ProtocolPurpose.purpose).\
+        join(Client).join((ProtocolPurpose, File.protocol_purposes)).join(Protocol).filter(Protocol.name == protocol)
+  if gender:
+    q = q.filter(Client.gender == gender)
+
+  lists = dict((name, {}) for name in ('world', 'dev-enroll', 'dev-probe', 'eval-enroll', 'eval-probe'))
+  file_ids = {}
+  for file_id, path, client_id, client_group, group, purpose in q:
+    file_ids[path] = file_id
+    if group == 'world':
+      if client_group == 'world': lists['world'][path] = client_id
+    else:
+      lists['%s-%s' % (group, purpose)][path] = client_id
+  lists = dict((name, sorted(files.items())) for name, files in lists.items())
+
+  protocol_gender = db.query(Protocol.gender).filter(Protocol.name == protocol).one()[0]
+  models = {'dev': [], 'eval': []}
+  for client_id, group in db.query(Client.id, Client.sgroup).filter(Client.sgroup.in_(('dev', 'eval'))).filter(Client.gender == protocol_gender).order_by(Client.id):
+    models[group].append(client_id)
+  return lists, models, file_ids
+
+def write_scores(output, probes, models):
+  """Writes one line for each pair of probe and model to the given stream; the
+  lines of each probe are assembled with a single join"""
+
+  parts = ['%03d %03d' % (m, m) for m in models]
+  if not parts: return
+  for path, client_id in probes:
+    suffix = ' %03d\n' % client_id
+    output.write(path + ' ' + (suffix + path + ' ').join(parts) + suffix)
+
+# the name of the manifest written by :py:func:`generate` in each protocol directory
+MANIFEST = 'manifest.json'
+
+class _HashingWriter(object):
+  """Writes text to a file and computes the SHA-256 digest of its contents"""
+
+  def __init__(self, f):
+    import hashlib
+    self.f = f
+    self.hash = hashlib.sha256()
+
+  def write(self, text):
+    if self.f is not None: self.f.write(text)
+    self.hash.update(text.encode('utf-8'))
+
+def read_manifest(base_dir):
+  """Returns the manifest of the lists in the given directory, or None"""
+
+  import json
+  filename = os.path.join(base_dir, MANIFEST)
+  if not os.path.exists(filename): return None
+  with open(filename) as f:
+    return json.load(f)
+
+def generate(protocol, output_dir='./protocols/', gender_dependent=False, db=None, force=False, compact=False, format='text'):
+  """Generates the file lists of the given protocol in a sub-directory of
+  ``output_dir`` (with suffix '_GD' if ``gender_dependent``, in which case the
+  world list only contains the clients of the gender of the protocol).
+
+  A manifest records the fingerprint of the database, the arguments and the
+  digest of each list. If they are unchanged and all lists are present, the
+  lists are not generated again, unless ``force`` is set. Otherwise, each list
+  is written to a temporary file, which only replaces the list (atomically) if
+  its contents changed, so that the modification times of unchanged lists are
+  kept.
+
+  If ``compact`` is set, the list of all probe and model pairs of each group
+  is replaced by the list of models and the list of probes, which are read by
+  :py:mod:`bob.db.mobio.filelists`; all probes are scored against all models
+  in MOBIO, so no exceptions are written.
+
+  The lists are written in one of the :py:data:`bob.db.mobio.filelists.FORMATS`
+  ('text', 'gz', 'zst' or 'npz'), and can be read back with
+  :py:func:`bob.db.mobio.filelists.read_list`.
+
+  Returns a dictionary with the number of lines of each list."""
+
+  import json
+  from .filesystem import file_digest
+  from . import filelists
+
+  if db is None:
+    db = Database()
+  if protocol not in db.protocol_names():
+    raise ValueError("The given protocol name '%s' does not exist."%protocol)
+  if format not in filelists.FORMATS:
+    raise ValueError("The format '%s' is not known; choose one of %s." % (format, ', '.join(filelists.FORMATS)))
+
+  base_dir = os.path.join(output_dir, protocol + ('_GD' if gender_dependent else ''))
+  manifest = {
+    'fingerprint': db.fingerprint(),
+    'arguments': {'protocol': protocol, 'gender_dependent': gender_dependent, 'compact': compact, 'format': format},
+    'files': {},
+  }
+  previous = read_manifest(base_dir) or {'files': {}}
+  if not force and previous.get('fingerprint') == manifest['fingerprint'] and previous.get('arguments') == manifest['arguments'] and \
+      previous['files'] and all(os.path.exists(os.path.join(base_dir, name)) for name in previous['files']):
+    return dict((name, entry['lines']) for name, entry in previous['files'].items())
+
+  gender_value = 'female' if 'female' in protocol else 'male'
+  lists, models, file_ids = collect(db, protocol, gender_value if gender_dependent else None)
+
+  for name in ('norm', 'dev', 'eval'):
+    ensure_dir(os.path.join(base_dir, name))
+
+  import numpy
+  def arrays(files, **kwargs):
+    # the arrays of the npz format for the given (path, client_id) pairs
+    kwargs['path'] = numpy.array([f[0] for f in files], dtype='U')
+    kwargs['file_id'] = numpy.array([file_ids[f[0]] for f in files], dtype=numpy.int64)
+    kwargs['client_id'] = numpy.array([f[1] for f in files], dtype=numpy.int64)
+    return kwargs
+
+  def write_list(name, lines, text, data):
+    # writes the list with the given text name, either with the function
+    # ``text``, which writes to a stream, or the arrays returned by ``data``
+    name = name[:name.index('/') + 1] + filelists.list_filename(name[name.index('/') + 1:], format)
+    filename = os.path.join(base_dir, name)
+    temp = filename + '.tmp'
+    if format == 'npz':
+      values = data()
+      writer = _HashingWriter(None)
+      for key in sorted(values):
+        writer.hash.update(key.encode('utf-8'))
+        writer.hash.update(numpy.ascontiguousarray(values[key]).tobytes())
+      with open(temp, 'wb') as f:
+        numpy.savez(f, **values)
+    else:
+      with filelists.open_list(temp, 'w', format if format != 'text' else None) as f:
+        writer = _HashingWriter(f)
+        text(writer)
+    digest = writer.hash.hexdigest()
+    old = previous['files'].get(name, {}).get('sha256')
+    # without a manifest, only plain text lists can be compared with the file
+    # on disk, since the digest of the other formats is not the one of the file
+    if old is None and format == 'text' and os.path.exists(filename): old = file_digest(filename)[2]
+    if old == digest and os.path.exists(filename):
+      os.remove(temp)
+    else:
+      os.rename(temp, filename)
+    manifest['files'][name] = {'sha256': digest, 'lines': lines}
+
+  world = lists['world']
+  write_list('norm/train_world.lst', len(world),
+      lambda f: f.write(''.join('%s %03d\n' % (path, client_id) for path, client_id in world)),
+      lambda: arrays(world))
+
+  for group in ('dev', 'eval'):
+    enroll = lists[group + '-enroll']
+    write_list(group + '/for_models.lst', len(enroll),
+        lambda f: f.write(''.join('%s %03d %03d\n' % (path, client_id, client_id) for path, client_id in enroll)),
+        lambda: arrays(enroll, model_id=numpy.array([f[1] for f in enroll], dtype=numpy.int64)))
+
+    probes = lists[group + '-probe']
+    group_models = models[group]
+    if compact:
+      write_list(group + '/' + filelists.MODELS, len(group_models),
+          lambda f: f.write(''.join('%03d\n' % m for m in group_models)),
+          lambda: {'model_id': numpy.array(group_models, dtype=numpy.int64)})
+      write_list(group + '/' + filelists.PROBES, len(probes),
+          lambda f: f.write(''.join('%s %03d\n' % (path, client_id) for path, client_id in probes)),
+          lambda: arrays(probes))
+    else:
+      write_list(group + '/for_scores.lst', len(probes) * len(group_models),
+          lambda f: write_scores(f, probes, group_models),
+          lambda: arrays(probes, model_id=numpy.tile(numpy.array(group_models, dtype=numpy.int64), len(probes)),
+              probe_index=numpy.repeat(numpy.arange(len(probes), dtype=numpy.int32), len(group_models))))
+
+  # lists of the previous generation that are not generated any more (e.g., with a different 'compact')
+  for name in previous['files']:
+    if name not in manifest['files'] and os.path.exists(os.path.join(base_dir, name)):
+      os.remove(os.path.join(base_dir, name))
+
+  filename = os.path.join(base_dir, MANIFEST)
+  with open(filename + '.tmp', 'w') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  os.rename(filename + '.tmp', filename)
+
+  return dict((name, entry['lines']) for name, entry in manifest['files'].items())
+
+# the database of the worker processes of the pool used by :py:func:`generate_all`
+_worker_db = None
+
+def _open_worker_db(fingerprint=None):
+  global _worker_db
+  _worker_db = Database()
+  # the fingerprint is computed once by the parent process, for databases that do not store it
+  if fingerprint is not None: _worker_db.m_fingerprint = fingerprint
+
+def _generate_job(job):
+  import time
+  protocol, output_dir, gender_dependent, force, compact, format = job
+  start = time.time()
+  lines = generate(protocol, output_dir, gender_dependent, _worker_db, force, compact, format)
+  return protocol, gender_dependent, time.time() - start, sum(lines.values())
+
+def generate_all(protocols, output_dir='./protocols/', variants=(False,), jobs=None, force=False, compact=False, format='text'):
+  """Generates the file lists of several protocols concurrently, on a pool of
+  ``jobs`` processes (by default, one per job up to the number of CPUs); each
+  process opens its own database once. ``variants`` contains the
+  values of ``gender_dependent`` to generate for each protocol; ``force``,
+  ``compact`` and ``format`` are passed to :py:func:`generate`.
+
+  Returns the list of ``(protocol, gender_dependent, seconds, lines)`` of each
+  generated protocol, in the order of the requests."""
+
+  import multiprocessing
+  requests = [(p, output_dir, g, force, compact, format) for p in protocols for g in variants]
+  if jobs is None:
+    jobs = min(len(requests), multiprocessing.cpu_count())
+  if jobs <= 1:
+    _open_worker_db()
+    return [_generate_job(r) for r in requests]
+  pool = multiprocessing.Pool(jobs, _open_worker_db, (Database().fingerprint(),))
+  try:
+    return pool.map(_generate_job, requests, chunksize=1)
+  finally:
+    pool.close()
+    pool.join()
+
+def main(command_line_parameters = None):
   """Executes the main function"""
 
   parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -58,136 +296,49 @@ def main():
 
   parser.add_argument('-g', '--gender-dependent', action='store_true', dest='gender_dependent', default=False, help='Use gender dependent Training data (defaults to "%(default)s")')
 
-  parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=False, help="Increase some verbosity")
-
-  args = parser.parse_args()
-
-
-  ########################
-  # Loading Hiperparameters
-  #########################
-  m_output_dir = args.output_dir
-  m_protocol_name = args.protocol_name
-  m_gender_dependent = args.gender_dependent
-
-  # verify that the protocol name exists
-  db = Database()
-  if m_protocol_name not in db.protocol_names():
-    raise ValueError("The given protocol name '%s' does not exist."%m_protocol_name)
-
-  gender_value = 'female'
-  if m_protocol_name.find(gender_value) == -1:
-    gender_value = 'male'
-  print('gender: %s' % gender_value)
-
-
-
-  ### List for world group
-  if (m_gender_dependent):
-    world_dir = m_output_dir +'/' + m_protocol_name + '_GD/' + 'norm'
-    #world_dir = m_output_dir +'/' + m_protocol_name + '_GD/' + 'world'
-    dev_dir = m_output_dir +'/' + m_protocol_name + '_GD/' + 'dev'
-    eval_dir = m_output_dir +'/' + m_protocol_name + '_GD/' + 'eval'
-  else:
-    world_dir = m_output_dir +'/' + m_protocol_name + '/' + 'norm'
-    #world_dir = m_output_dir +'/' + m_protocol_name + '/' + 'world'
-    dev_dir = m_output_dir +'/' + m_protocol_name + '/' + 'dev'
-    eval_dir = m_output_dir +'/' + m_protocol_name + '/' + 'eval'
-
-  # ensure directories
-  ensure_dir(world_dir)
-  ensure_dir(dev_dir)
-  ensure_dir(eval_dir)
-
-  ### List for world group (norm/train_world.lst)
-  if (m_gender_dependent):
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="world", gender = gender_value))
-  else:
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="world"))
-
-  files =  sort_by_pathes(files)
-  known = set()
-  file_list = open(world_dir+'/train_world.lst', 'w')
+  parser.add_argument('-P', '--protocols', nargs='+', metavar='PROTOCOL', help='Generate the lists of several protocols, instead of the --protocol-name')
 
-  for file in files:
-    if file.path not in known and not known.add(file.path):
-      file_list.write(file.path + ' ' + (str(file.client_id)).zfill(3) + '\n')
-  file_list.close()
+  parser.add_argument('-a', '--all-protocols', action='store_true', help='Generate the lists of all protocols of the database')
 
+  parser.add_argument('-b', '--both-variants', action='store_true', help='Generate both the gender dependent and independent lists of each protocol')
 
-  ### List of DEV.clients (dev/for_models.lst) group
-  if (m_gender_dependent):
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="dev", purposes='enroll', gender = gender_value))
-  else:
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="dev", purposes='enroll'))
-
-  files = sort_by_pathes(files)
-  known = set()
-  file_list = open(dev_dir+'/for_models.lst', 'w')
-
-  for file in files:
-    if file.path not in known and not known.add(file.path):
+  parser.add_argument('-j', '--jobs', type=int, help='Number of protocols generated in parallel (defaults to one per protocol, up to the number of CPUs)')
 
-      file_list.write(file.path + ' ' + (str(file.client_id)).zfill(3) + ' ' + (str(file.client_id)).zfill(3) + '\n')
-  file_list.close()
-
-  ### List of DEV.trials (dev/for_scores.lst) group
-  if (m_gender_dependent):
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="dev", purposes='probe', gender = gender_value))
-  else:
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="dev", purposes='probe'))
+  parser.add_argument('-f', '--force', action='store_true', help='Generate the lists again, even if the manifest shows that neither the database nor the arguments changed')
 
-  files = sort_by_pathes(files)
+  parser.add_argument('-c', '--compact', action='store_true', help='Write the lists of models and probes of each group, instead of the list of all pairs (for_scores.lst); see bob.db.mobio.filelists')
 
-  clients =sort_by_ids(db.clients(protocol=m_protocol_name, groups="dev"))
+  parser.add_argument('-F', '--format', default='text', choices=('text', 'gz', 'zst', 'npz'), help='Format of the lists: plain text, text compressed with gzip or zstandard, or numpy arrays of the file and client ids with a table of the paths; see bob.db.mobio.filelists (defaults to "%(default)s")')
 
-  known = set()
-  file_list = open(dev_dir+'/for_scores.lst', 'w')
-  #file_list = open(dev_dir+'/trials.lst', 'w')
-
-  for file in files:
-    if file.path not in known and not known.add(file.path):
-      for c in clients:
-        file_list.write(file.path + ' ' + (str(c.id)).zfill(3) + ' ' + (str(c.id)).zfill(3) + ' ' + (str(file.client_id)).zfill(3) +'\n')
-  file_list.close()
-
-
-  ### List of EVAL.clients (eval/for_models.lst) group
-  if (m_gender_dependent):
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="eval", purposes='enroll', gender = gender_value))
-  else:
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="eval", purposes='enroll'))
-
-  files = sort_by_pathes(files)
-  known = set()
-  file_list = open(eval_dir+'/for_models.lst', 'w')
-
-  for file in files:
-    if file.path not in known and not known.add(file.path):
+  parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=False, help="Increase some verbosity")
 
-      file_list.write(file.path + ' ' + (str(file.client_id)).zfill(3) + ' ' + (str(file.client_id)).zfill(3) + '\n')
-  file_list.close()
+  args = parser.parse_args(command_line_parameters)
 
-  ### List of EVAL.trials (eval/for_scores.lst) group
-  if (m_gender_dependent):
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="eval", purposes='probe', gender = gender_value))
+  if args.all_protocols:
+    protocols = list(Database().protocol_names())
+  elif args.protocols:
+    protocols = args.protocols
   else:
-    files = sort_by_ids(db.objects(protocol=m_protocol_name, groups="eval", purposes='probe'))
-
-  files = sort_by_pathes(files)
-  clients =sort_by_ids(db.clients(protocol=m_protocol_name, groups="eval"))
-  known = set()
-  file_list = open(eval_dir+'/for_scores.lst', 'w')
-  #file_list = open(eval_dir+'/trials.lst', 'w')
-
-  for file in files:
-    if file.path not in known and not known.add(file.path):
-      for c in clients:
-        file_list.write(file.path + ' ' + (str(c.id)).zfill(3) + ' ' + (str(c.id)).zfill(3) + ' ' + (str(file.client_id)).zfill(3) +'\n')
-  file_list.close()
-
-
+    protocols = [args.protocol_name]
+  variants = (False, True) if args.both_variants else (args.gender_dependent,)
+
+  if len(protocols) * len(variants) == 1:
+    gender_value = 'female' if 'female' in protocols[0] else 'male'
+    print('gender: %s' % gender_value)
+    lines = generate(protocols[0], args.output_dir, variants[0], force=args.force, compact=args.compact, format=args.format)
+    if args.verbose:
+      for name in sorted(lines):
+        print('%s: %d lines' % (name, lines[name]))
+    return 0
+
+  import time
+  start = time.time()
+  results = generate_all(protocols, args.output_dir, variants, args.jobs, args.force, args.compact, args.format)
+  for protocol, gender_dependent, seconds, lines in results:
+    print('%-25s %8.2f s %10d lines' % (protocol + ('_GD' if gender_dependent else ''), seconds, lines))
+  print('Generated %d protocols in %.2f s' % (len(results), time.time() - start))
+
+  return 0
 
 if __name__ == "__main__":
   main()
-
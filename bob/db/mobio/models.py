@@ -209,3 +209,58 @@ class ProtocolPurpose(Base):
 
   def __repr__(self):
     return "ProtocolPurpose('%s', '%s', '%s')" % (self.protocol.name, self.sgroup, self.purpose)
+
+class BuildState(Base):
+  """Progress of the database creation, used to resume an interrupted build"""
+
+  __tablename__ = 'buildstate'
+
+  # Unique identifier for this build state object
+  id = Column(Integer, primary_key=True)
+  # Name of the build phase ('files', 'subworlds', 'protocols')
+  phase = Column(String(20))
+  # Completed item of the phase (e.g., a client directory), or None if the whole phase is completed
+  item = Column(String(100))
+
+  def __init__(self, phase, item=None):
+    self.phase = phase
+    self.item = item
+
+  def __repr__(self):
+    return "BuildState('%s', '%s')" % (self.phase, self.item)
+
+class Metadata(Base):
+  """Information about the database itself, such as the fingerprint of its content"""
+
+  __tablename__ = 'metadata'
+
+  # Unique identifier for this metadata object
+  id = Column(Integer, primary_key=True)
+  # Name of the information
+  name = Column(String(20), unique=True)
+  # Value of the information
+  value = Column(String(100))
+
+  def __init__(self, name, value):
+    self.name = name
+    self.value = value
+
+  def __repr__(self):
+    return "Metadata('%s', '%s')" % (self.name, self.value)
+
+def content_fingerprint(session):
+  """Computes a fingerprint (a SHA-256 hexadecimal digest) of the database
+  content. The fingerprint depends only on the rows of the tables (including
+  the ids), but neither on the order in which they are stored, nor on the build
+  state or on the metadata."""
+
+  import hashlib
+  digest = hashlib.sha256()
+  ignored = (BuildState.__tablename__, Metadata.__tablename__)
+  for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+    if table.name in ignored: continue
+    columns = list(table.columns)
+    digest.update((u'%s(%s)\n' % (table.name, u','.join(c.name for c in columns))).encode('utf-8'))
+    for row in session.execute(table.select().order_by(*columns)):
+      digest.update((u'\t'.join(u'%s' % (v,) for v in row) + u'\n').encode('utf-8'))
+  return digest.hexdigest()
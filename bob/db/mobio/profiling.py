@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+#
+# Copyright (C) 2011-2013 Idiap Research Institute, Martigny, Switzerland
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Opt-in profiling of the calls to the methods of the MOBIO database.
+
+Profiling is enabled with :py:meth:`bob.db.mobio.Database.enable_profiling`,
+or for all databases of a process by setting the environment variable
+:py:data:`PROFILE_VARIABLE` to the name of a JSON file; all databases then
+record their calls in a single profile (see :py:func:`process_profile`), whose
+report is written to the file when the interpreter exits. Hooks, i.e.,
+callables ``hook(method, elapsed, statements, rows)``, receive each call as it
+is recorded, e.g., to send it to a metrics system.
+"""
+
+import math
+import time
+import warnings
+import threading
+import functools
+
+PROFILE_VARIABLE = 'BOB_DB_MOBIO_PROFILE'
+
+def percentile(values, p):
+  """Returns the ``p``-th percentile (nearest rank) of the sorted values"""
+  if not values: return None
+  index = int(math.ceil(p / 100. * len(values))) - 1
+  return values[min(max(index, 0), len(values) - 1)]
+
+def _rows(retval):
+  """The number of rows returned by a method, if it returns a collection"""
+  return len(retval) if isinstance(retval, (list, tuple, set, dict)) else None
+
+
+class Profile(object):
+  """Records the calls to the methods of a database; it can be shared between
+  threads"""
+
+  def __init__(self, hooks=()):
+    self.hooks = list(hooks)
+    self.m_calls = {}
+    self.m_lock = threading.Lock()
+
+  def add_hook(self, hook):
+    """Adds a callable ``hook(method, elapsed, statements, rows)``, which is
+    called after each recorded call; ``rows`` is None if the method does not
+    return a collection"""
+    self.hooks.append(hook)
+
+  def record(self, method, elapsed, statements, rows):
+    """Records a call to the given method, which took ``elapsed`` seconds,
+    executed ``statements`` SQL statements and returned ``rows`` rows"""
+
+    with self.m_lock:
+      calls = self.m_calls.get(method)
+      if calls is None: calls = self.m_calls[method] = [[], 0, 0]
+      calls[0].append(elapsed)
+      calls[1] += statements
+      calls[2] += rows or 0
+    for hook in self.hooks:
+      # profiling must not break the queries
+      try:
+        hook(method, elapsed, statements, rows)
+      except Exception as e:
+        warnings.warn("The profiling hook %r failed for '%s': %s" % (hook, method, e))
+
+  def wrap(self, method, name, statement_count, depth):
+    """Returns the given (bound) method, recording each of its calls;
+    ``statement_count`` returns the number of SQL statements executed so far.
+    ``depth`` is a list holding the number of running calls of the methods of
+    the same object: calls made by another recorded method are not recorded,
+    as they are part of the outer call."""
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+      if depth[0]: return method(*args, **kwargs)
+      depth[0] += 1
+      try:
+        statements = statement_count()
+        start = time.time()
+        retval = method(*args, **kwargs)
+      finally:
+        depth[0] -= 1
+      self.record(name, time.time() - start, statement_count() - statements, _rows(retval))
+      return retval
+    return wrapper
+
+  def report(self):
+    """Returns the report of the recorded calls, see :py:func:`report`"""
+    return report([self])
+
+def report(profiles):
+  """Returns the report of the calls recorded by all given profiles: a
+  dictionary mapping each called method to a dictionary with the number of
+  ``calls``, the ``total`` time and the ``p50``, ``p95`` and ``p99``
+  percentiles of the time of a call (in seconds), and the total number of
+  SQL ``statements`` and returned ``rows``"""
+
+  calls = {}
+  for profile in profiles:
+    with profile.m_lock:
+      for method, (times, statements, rows) in profile.m_calls.items():
+        merged = calls.setdefault(method, [[], 0, 0])
+        merged[0].extend(times)
+        merged[1] += statements
+        merged[2] += rows
+
+  result = {}
+  for method, (times, statements, rows) in calls.items():
+    times.sort()
+    result[method] = {
+      'calls': len(times),
+      'total': sum(times),
+      'p50': percentile(times, 50),
+      'p95': percentile(times, 95),
+      'p99': percentile(times, 99),
+      'statements': statements,
+      'rows': rows,
+    }
+  return result
+
+# the profile shared by all databases of the process
+_process_profile = None
+_process_lock = threading.Lock()
+
+def _dump(profile, filename):
+  import json
+  with open(filename, 'w') as f:
+    json.dump(profile.report(), f, indent=2, sort_keys=True)
+
+def process_profile(filename):
+  """Returns the profile shared by all databases of the process, creating it
+  on first use; its report is written to the given JSON file when the
+  interpreter exits"""
+
+  global _process_profile
+  with _process_lock:
+    if _process_profile is None:
+      import atexit
+      _process_profile = Profile()
+      atexit.register(_dump, _process_profile, filename)
+    return _process_profile
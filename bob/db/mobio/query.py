@@ -22,29 +22,194 @@ MOBIO database in the most obvious ways.
 
 import os
 import six
+import functools
 from bob.db.base import utils
 from .models import *
 from .driver import Interface
+from . import sharding
+from . import profiling
 
 import bob.db.verification.utils
 
 SQLITE_FILE = Interface().files()[0]
 
+# the categories of the enumerated columns of the DataFrames returned by the Database
+FRAME_CATEGORIES = {
+  'gender': Client.gender_choices,
+  'sgroup': Client.group_choices,
+  'institute': Client.institute_choices,
+  'speech_type': File.speech_type_choices,
+  'environment': File.environment_choices,
+  'device': File.device_choices,
+}
+
+# the keys by which the statistics of the Database can be grouped, and their columns
+STATS_COLUMNS = {
+  'protocol': Protocol.name,
+  'group': ProtocolPurpose.sgroup,
+  'purpose': ProtocolPurpose.purpose,
+  'client': File.client_id,
+  'gender': Client.gender,
+  'institute': Client.institute,
+  'session': File.session_id,
+  'speech_type': File.speech_type,
+  'shot': File.shot_id,
+  'environment': File.environment,
+  'device': File.device,
+  'channel': File.channel_id,
+}
+
+# the query methods of the Database that are profiled
+PROFILED_METHODS = ('clients', 'tclients', 'zclients', 'client', 'models',
+    'model_ids', 'tmodels', 'tmodel_ids', 'objects', 'tobjects', 'zobjects',
+    'objects_frame', 'clients_frame', 'trials_frame', 'stats', 'annotations',
+    'paths', 'reverse', 'fingerprint')
+
+def _tracked(method):
+  """Decorates the query methods, so that in debug mode, a warning is issued as
+  soon as many SQL statements are executed after the method returned (and
+  before the next query), which is most likely the lazy loading of the
+  relationships of each returned object (the N+1 queries problem)"""
+
+  @functools.wraps(method)
+  def wrapper(self, *args, **kwargs):
+    if self.debug: self.m_last_call = None
+    retval = method(self, *args, **kwargs)
+    if self.debug: self.m_last_call = (method.__name__, len(retval), self.statement_count())
+    return retval
+  return wrapper
+
 class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.utils.ZTDatabase):
   """The dataset class opens and maintains a connection opened to the Database.
 
   It provides many different ways to probe for the characteristics of the data
   and for the data itself inside the database.
+
+  By default, the relationships of the returned objects (e.g. the ``client`` of
+  a File) are loaded with one query per object when they are first accessed.
+  The ``load`` parameter of the query methods lists relationships that are
+  loaded eagerly with the query instead. If the environment variable
+  ``BOB_DB_MOBIO_DEBUG`` is set (or the ``debug`` attribute), a warning is
+  issued as soon as many objects returned by a query are loaded one by one.
   """
 
-  def __init__(self, original_directory = None, original_extension = None, annotation_directory = None, annotation_extension = '.pos'):
-    # call base class constructors to open a session to the database
-    bob.db.verification.utils.SQLiteDatabase.__init__(self, SQLITE_FILE, File)
+  def __init__(self, original_directory = None, original_extension = None, annotation_directory = None, annotation_extension = '.pos', sqlite_file = None):
+    # call base class constructors to open a session to the database; another
+    # SQLite file than the installed one can be given, e.g., for benchmarks
+    bob.db.verification.utils.SQLiteDatabase.__init__(self, sqlite_file or SQLITE_FILE, File)
     bob.db.verification.utils.ZTDatabase.__init__(self, original_directory=original_directory, original_extension=original_extension)
 
     self.annotation_directory = annotation_directory
     self.annotation_extension = annotation_extension
 
+    # in debug mode, lazy loads after the queries are detected
+    self.debug = bool(os.environ.get('BOB_DB_MOBIO_DEBUG'))
+    self.m_statements = None
+    self.m_last_call = None
+    self.m_fingerprint = None
+
+    # the profile of the calls, if profiling is enabled
+    self.m_profile = None
+    filename = os.environ.get(profiling.PROFILE_VARIABLE)
+    if filename:
+      self.enable_profiling(profile=profiling.process_profile(filename))
+
+  def statement_count(self):
+    """Returns the number of SQL statements executed by this database so far;
+    they are counted from the first call of this method on"""
+
+    if self.m_statements is None:
+      if self.m_session is None: return 0
+      from sqlalchemy import event
+      self.m_statements = [0]
+      def count(*args):
+        self.m_statements[0] += 1
+        if self.m_last_call is not None: self._check_lazy_loads()
+      event.listen(self.m_session.bind, 'after_cursor_execute', count)
+    return self.m_statements[0]
+
+  def enable_profiling(self, hooks=(), profile=None):
+    """Records the calls to the :py:data:`PROFILED_METHODS` of this database,
+    see :py:mod:`bob.db.mobio.profiling`; calls made by another of these
+    methods are only counted in the outer call. The calls are recorded in the
+    given ``profile``, e.g., one shared by several databases, or in a new one,
+    and the given ``hooks`` are added to it. Returns the
+    :py:class:`bob.db.mobio.profiling.Profile`."""
+
+    if self.m_profile is None:
+      self.m_profile = profile or profiling.Profile()
+      depth = [0]
+      for name in PROFILED_METHODS:
+        setattr(self, name, self.m_profile.wrap(getattr(self, name), name, self.statement_count, depth))
+    for hook in hooks:
+      self.m_profile.add_hook(hook)
+    return self.m_profile
+
+  def profile_report(self):
+    """Returns the report of the calls recorded since profiling was enabled
+    (see :py:func:`bob.db.mobio.profiling.report`), including the ones of the
+    other databases sharing its profile, or an empty dictionary if it is not
+    enabled"""
+
+    if self.m_profile is None: return {}
+    return self.m_profile.report()
+
+  def close(self):
+    """Closes the session and the connections to the SQLite file; the database
+    cannot be queried afterwards. SQLite connections can only be closed by the
+    thread that opened them."""
+
+    if self.m_session is not None:
+      bind = self.m_session.bind
+      self.m_session.close()
+      bind.dispose()
+      self.m_session = None
+
+  def _check_lazy_loads(self, threshold=10):
+    """Warns once if more than ``threshold`` statements were executed since the last query method returned"""
+
+    name, count, statements = self.m_last_call
+    lazy = self.m_statements[0] - statements
+    if lazy > threshold:
+      self.m_last_call = None
+      import warnings
+      warnings.warn("%d SQL statements were executed after %s() returned %d objects, probably to load their relationships one by one; consider the 'load' parameter of %s()." % (lazy, name, count, name))
+
+  def _load_options(self, entity, load):
+    """Returns the query options to eagerly load the given relationships of the
+    entity: joined loading for many-to-one relationships, and select-in (or
+    subquery) loading for collections"""
+
+    if not load: return []
+    if isinstance(load, six.string_types): load = (load,)
+    from sqlalchemy import orm
+    relationships = dict((r.key, r) for r in orm.class_mapper(entity).relationships)
+    options = []
+    for name in load:
+      if name not in relationships:
+        raise ValueError("'%s' is not a relationship of %s; choose one of %s." % (name, entity.__name__, ', '.join(sorted(relationships))))
+      attribute = getattr(entity, name)
+      if relationships[name].uselist:
+        options.append(getattr(orm, 'selectinload', orm.subqueryload)(attribute))
+      else:
+        options.append(orm.joinedload(attribute))
+    return options
+
+  def _shard(self, q, shard, cost):
+    """Restricts the query of Files to the given shard, using their id modulo the
+    number of shards, unless the shards are balanced by ``cost``"""
+
+    if shard is None: return q
+    index, count = sharding.check_shard(shard)
+    if cost is not None: return q
+    return q.filter(File.id % count == index)
+
+  def _select_shard(self, files, shard, cost):
+    """Selects the Files of the given shard balanced by ``cost``, if any"""
+
+    if shard is None or cost is None: return files
+    return sharding.select(files, shard, cost)
+
   def groups(self, protocol=None):
     """Returns the names of all registered groups"""
 
@@ -91,7 +256,8 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
         return list(set(self._replace_protocol_alias(k) for k in protocols))
     else: return None
 
-  def clients(self, protocol=None, groups=None, subworld=None, gender=None):
+  @_tracked
+  def clients(self, protocol=None, groups=None, subworld=None, gender=None, load=None):
     """Returns a list of Clients for the specific query by the user.
 
     Keyword Parameters:
@@ -113,17 +279,31 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     gender
       The gender to consider ('male', 'female')
 
+    load
+      The relationships of the returned Clients to load eagerly, e.g. ('subworld',); see the
+      :py:class:`Database` documentation.
+
     Returns: A list containing all the clients which have the given properties.
     """
 
+    retval = []
+    options = self._load_options(Client, load)
+    for q in self._clients_queries(protocol, groups, subworld, gender):
+      retval += list(q.options(*options))
+    return retval
+
+  def _clients_queries(self, protocol=None, groups=None, subworld=None, gender=None):
+    """Returns the list of queries of Clients whose results are concatenated by
+    :py:meth:`clients`"""
+
     protocol = self._replace_protocols_alias(protocol)
     protocol = self.check_parameters_for_validity(protocol, "protocol", self.protocol_names(), [])
     groups = self.check_parameters_for_validity(groups, "group", self.groups(), self.groups())
     subworld = self.check_parameters_for_validity(subworld, "subworld", self.subworld_names(), [])
     gender = self.check_parameters_for_validity(gender, "gender", self.genders(), [])
 
-    # List of the clients
-    retval = []
+    # List of the queries
+    queries = []
     if 'world' in groups:
       q = self.query(Client).filter(Client.sgroup == 'world')
       if subworld:
@@ -131,7 +311,7 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
       if gender:
         q = q.filter(Client.gender.in_(gender))
       q = q.order_by(Client.id)
-      retval += list(q)
+      queries.append(q)
 
     dev_eval = []
     if 'dev' in groups: dev_eval.append('dev')
@@ -147,9 +327,9 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
       if gender:
         q = q.filter(Client.gender.in_(gender))
       q = q.order_by(Client.id)
-      retval += list(q)
+      queries.append(q)
 
-    return retval
+    return queries
 
   def has_client_id(self, id):
     """Returns True if we have a client with a certain integer identifier"""
@@ -162,7 +342,7 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
 
     return self.query(Client).filter(Client.id==id).one()
 
-  def tclients(self, protocol=None, groups=None, subworld='onethird', gender=None):
+  def tclients(self, protocol=None, groups=None, subworld='onethird', gender=None, load=None):
     """Returns a set of T-Norm clients for the specific query by the user.
 
     Keyword Parameters:
@@ -184,12 +364,16 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     gender
       The gender to consider ('male', 'female')
 
+    load
+      The relationships of the returned Clients to load eagerly, e.g. ('subworld',); see the
+      :py:class:`Database` documentation.
+
     Returns: A list containing all the T-norm clients belonging to the given group.
     """
 
-    return self.clients(protocol, 'world', subworld, gender)
+    return self.clients(protocol, 'world', subworld, gender, load)
 
-  def zclients(self, protocol=None, groups=None, subworld='onethird', gender=None):
+  def zclients(self, protocol=None, groups=None, subworld='onethird', gender=None, load=None):
     """Returns a set of Z-Norm clients for the specific query by the user.
 
     Keyword Parameters:
@@ -211,12 +395,16 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     gender
       The gender to consider ('male', 'female')
 
+    load
+      The relationships of the returned Clients to load eagerly, e.g. ('subworld',); see the
+      :py:class:`Database` documentation.
+
     Returns: A list containing all the Z-norm clients belonging to the given group.
     """
 
-    return self.clients(protocol, 'world', subworld, gender)
+    return self.clients(protocol, 'world', subworld, gender, load)
 
-  def models(self, protocol=None, groups=None, subworld=None, gender=None):
+  def models(self, protocol=None, groups=None, subworld=None, gender=None, load=None):
     """Returns a set of models for the specific query by the user.
 
     Keyword Parameters:
@@ -238,10 +426,14 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     gender
       The gender to consider ('male', 'female')
 
+    load
+      The relationships of the returned Clients to load eagerly, e.g. ('subworld',); see the
+      :py:class:`Database` documentation.
+
     Returns: A list containing all the models belonging to the given group.
     """
 
-    return self.clients(protocol, groups, subworld, gender)
+    return self.clients(protocol, groups, subworld, gender, load)
 
   def model_ids(self, protocol=None, groups=None, subworld=None, gender=None):
     """Returns a set of models ids for the specific query by the user.
@@ -270,7 +462,8 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
 
     return [client.id for client in self.clients(protocol, groups, subworld, gender)]
 
-  def tmodels(self, protocol=None, groups=None, subworld='onethird', gender=None):
+  @_tracked
+  def tmodels(self, protocol=None, groups=None, subworld='onethird', gender=None, load=None):
     """Returns a set of T-Norm models for the specific query by the user.
 
     Keyword Parameters:
@@ -292,6 +485,10 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     gender
       The gender to consider ('male', 'female')
 
+    load
+      The relationships of the returned TModels to load eagerly, e.g. ('client', 'files'); see the
+      :py:class:`Database` documentation.
+
     Returns: A list containing all the T-norm models belonging to the given group.
     """
 
@@ -306,7 +503,7 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
       q = q.join((Subworld, Client.subworld)).filter(Subworld.name.in_(subworld))
     if gender:
       q = q.filter(Client.gender.in_(gender))
-    q = q.order_by(TModel.id)
+    q = q.order_by(TModel.id).options(*self._load_options(TModel, load))
     return list(q)
 
   def tmodel_ids(self, protocol=None, groups=None, subworld='onethird', gender=None):
@@ -347,8 +544,9 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     """
     return model_id
 
+  @_tracked
   def objects(self, protocol=None, purposes=None, model_ids=None,
-      groups=None, classes=None, subworld=None, gender=None, device=None):
+      groups=None, classes=None, subworld=None, gender=None, device=None, load=None, shard=None, shard_cost=None):
     """Returns a set of Files for the specific query by the user.
 
     Keyword Parameters:
@@ -390,9 +588,39 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     device
       The device to consider ('laptop', 'mobile')
 
+    load
+      The relationships of the returned Files to load eagerly, e.g. ('client', 'subworld'); see the
+      :py:class:`Database` documentation.
+
+    shard
+      A tuple ``(index, count)``; if given, only the Files of this shard of
+      ``count`` shards are returned. By default, the Files are partitioned by
+      their id modulo ``count``, in the query itself.
+
+    shard_cost
+      If given with ``shard``, a function returning the estimated cost of a
+      File; the Files are then partitioned into shards of balanced total cost
+      (see :py:func:`bob.db.mobio.sharding.partition`).
+
     Returns: A set of Files with the given properties.
     """
 
+    retval = []
+    known = set()
+    options = self._load_options(File, load)
+    for q in self._objects_queries(protocol, purposes, model_ids, groups, classes, subworld, gender, device):
+      for f in self._shard(q, shard, shard_cost).options(*options):
+        # removes duplicates, keeping the order of the queries
+        if f.id not in known:
+          known.add(f.id)
+          retval.append(f)
+    return self._select_shard(retval, shard, shard_cost)
+
+  def _objects_queries(self, protocol=None, purposes=None, model_ids=None,
+      groups=None, classes=None, subworld=None, gender=None, device=None):
+    """Returns the list of queries of Files whose results are combined by
+    :py:meth:`objects`; the Client of each File is joined in all of them."""
+
     protocol = self._replace_protocols_alias(protocol)
     protocol = self.check_parameters_for_validity(protocol, "protocol", self.protocol_names())
     purposes = self.check_parameters_for_validity(purposes, "purpose", self.purposes())
@@ -408,8 +636,8 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     elif not isinstance(model_ids, collections.Iterable):
       model_ids = (model_ids,)
 
-    # Now query the database
-    retval = []
+    # Now build the queries
+    queries = []
     if 'world' in groups and 'train' in purposes:
       q = self.query(File).join(Client).filter(Client.sgroup == 'world').join((ProtocolPurpose, File.protocol_purposes)).join(Protocol).\
             filter(and_(Protocol.name.in_(protocol), ProtocolPurpose.sgroup == 'world'))
@@ -422,7 +650,7 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
       if model_ids:
         q = q.filter(File.client_id.in_(model_ids))
       q = q.order_by(File.client_id, File.session_id, File.speech_type, File.shot_id, File.device)
-      retval += list(q)
+      queries.append(q)
 
     if ('dev' in groups or 'eval' in groups):
       if('enroll' in purposes):
@@ -435,7 +663,7 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
         if model_ids:
           q = q.filter(Client.id.in_(model_ids))
         q = q.order_by(File.client_id, File.session_id, File.speech_type, File.shot_id, File.device)
-        retval += list(q)
+        queries.append(q)
 
       if('probe' in purposes):
         if('client' in classes):
@@ -448,7 +676,7 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
           if model_ids:
             q = q.filter(Client.id.in_(model_ids))
           q = q.order_by(File.client_id, File.session_id, File.speech_type, File.shot_id, File.device)
-          retval += list(q)
+          queries.append(q)
 
         if('impostor' in classes):
           q = self.query(File).join(Client).join((ProtocolPurpose, File.protocol_purposes)).join(Protocol).\
@@ -460,11 +688,12 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
           if len(model_ids) == 1:
             q = q.filter(not_(File.client_id.in_(model_ids)))
           q = q.order_by(File.client_id, File.session_id, File.speech_type, File.shot_id, File.device)
-          retval += list(q)
+          queries.append(q)
 
-    return list(set(retval)) # To remove duplicates
+    return queries
 
-  def tobjects(self, protocol=None, model_ids=None, groups=None, subworld='onethird', gender=None, speech_type=None, device=None):
+  @_tracked
+  def tobjects(self, protocol=None, model_ids=None, groups=None, subworld='onethird', gender=None, speech_type=None, device=None, load=None, shard=None, shard_cost=None):
     """Returns a set of filenames for enrolling T-norm models for score
        normalization.
 
@@ -498,6 +727,20 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     device
       The device choice to consider ('mobile', 'laptop')
 
+    load
+      The relationships of the returned Files to load eagerly, e.g. ('client', 'subworld'); see the
+      :py:class:`Database` documentation.
+
+    shard
+      A tuple ``(index, count)``; if given, only the Files of this shard of
+      ``count`` shards are returned. By default, the Files are partitioned by
+      their id modulo ``count``, in the query itself.
+
+    shard_cost
+      If given with ``shard``, a function returning the estimated cost of a
+      File; the Files are then partitioned into shards of balanced total cost
+      (see :py:func:`bob.db.mobio.sharding.partition`).
+
     Returns: A set of Files with the given properties.
     """
 
@@ -525,11 +768,12 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
       q = q.filter(File.speech_type.in_(speech_type))
     if device:
       q = q.filter(File.device.in_(device))
-    q = q.order_by(File.client_id, File.session_id, File.speech_type, File.shot_id, File.device)
-    retval = [v[0] for v in q]
-    return list(retval)
+    q = q.order_by(File.client_id, File.session_id, File.speech_type, File.shot_id, File.device).options(*self._load_options(File, load))
+    retval = [v[0] for v in self._shard(q, shard, shard_cost)]
+    return self._select_shard(retval, shard, shard_cost)
 
-  def zobjects(self, protocol=None, model_ids=None, groups=None, subworld='onethird', gender=None, speech_type=['r','f'], device=['mobile']):
+  @_tracked
+  def zobjects(self, protocol=None, model_ids=None, groups=None, subworld='onethird', gender=None, speech_type=['r','f'], device=['mobile'], load=None, shard=None, shard_cost=None):
     """Returns a set of Files to perform Z-norm score normalization.
 
     Keyword Parameters:
@@ -562,6 +806,20 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     device
       The device choice to consider ('mobile', 'laptop')
 
+    load
+      The relationships of the returned Files to load eagerly, e.g. ('client', 'subworld'); see the
+      :py:class:`Database` documentation.
+
+    shard
+      A tuple ``(index, count)``; if given, only the Files of this shard of
+      ``count`` shards are returned. By default, the Files are partitioned by
+      their id modulo ``count``, in the query itself.
+
+    shard_cost
+      If given with ``shard``, a function returning the estimated cost of a
+      File; the Files are then partitioned into shards of balanced total cost
+      (see :py:func:`bob.db.mobio.sharding.partition`).
+
     Returns: A set of Files with the given properties.
     """
 
@@ -592,8 +850,160 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
       q = q.filter(File.device.in_(device))
     if model_ids:
       q = q.filter(File.client_id.in_(model_ids))
-    q = q.order_by(File.client_id, File.session_id, File.speech_type, File.shot_id, File.device)
-    return list(q)
+    q = q.order_by(File.client_id, File.session_id, File.speech_type, File.shot_id, File.device).options(*self._load_options(File, load))
+    return self._select_shard(list(self._shard(q, shard, shard_cost)), shard, shard_cost)
+
+  def _frame(self, queries, columns):
+    """Builds a pandas DataFrame from the rows of the given queries, selecting
+    the given ``(name, column)`` pairs only; enumerations become categoricals"""
+
+    import pandas
+    names = [n for n, c in columns]
+    rows = []
+    for q in queries:
+      rows.extend(q.with_entities(*[c.label(n) for n, c in columns]).all())
+    frame = pandas.DataFrame.from_records(rows, columns=names)
+    for name in names:
+      if name in FRAME_CATEGORIES:
+        frame[name] = pandas.Categorical(frame[name], categories=FRAME_CATEGORIES[name])
+    return frame
+
+  def objects_frame(self, protocol=None, purposes=None, model_ids=None,
+      groups=None, classes=None, subworld=None, gender=None, device=None):
+    """Returns the Files of :py:meth:`objects` as a pandas DataFrame, sorted by
+    file id, which is built from the rows of the queries without creating File
+    objects. Besides the columns of the File table, it contains the
+    ``gender``, ``sgroup`` and ``institute`` of the clients. The keyword
+    parameters are the ones of :py:meth:`objects`; pandas is required.
+    """
+
+    columns = [(c.key, getattr(File, c.key)) for c in File.__table__.columns] + \
+        [('gender', Client.gender), ('sgroup', Client.sgroup), ('institute', Client.institute)]
+    frame = self._frame(self._objects_queries(protocol, purposes, model_ids, groups, classes, subworld, gender, device), columns)
+    return frame.drop_duplicates('id').sort_values('id').reset_index(drop=True)
+
+  def clients_frame(self, protocol=None, groups=None, subworld=None, gender=None):
+    """Returns the Clients of :py:meth:`clients` as a pandas DataFrame, with the
+    columns of the Client table. The keyword parameters are the ones of
+    :py:meth:`clients`; pandas is required.
+    """
+
+    columns = [(c.key, getattr(Client, c.key)) for c in Client.__table__.columns]
+    return self._frame(self._clients_queries(protocol, groups, subworld, gender), columns)
+
+  def trials_frame(self, protocol=None, groups=None, gender=None, device=None, shard=None):
+    """Returns all verification trials of the given protocol as a pandas
+    DataFrame, i.e., each model of the 'dev' and 'eval' groups paired with each
+    probe File of the same group. Besides the ``model_id``, it contains the
+    columns of :py:meth:`objects_frame` for the probes (``id`` and
+    ``client_id`` are renamed into ``probe_id`` and ``probe_client_id``) and
+    the boolean ``target``, which is True for client trials.
+
+    Keyword Parameters:
+
+    protocol, gender, device
+      As in :py:meth:`objects`.
+
+    groups
+      The groups of the trials ('dev', 'eval') or a tuple with both of them.
+      If 'None' is given (this is the default), both are considered.
+
+    shard
+      A tuple ``(index, count)``; if given, only the trials of this shard of
+      the models of each group are returned, i.e., the models at positions
+      ``index``, ``index + count``, ... in the sorted list of models.
+    """
+
+    import numpy
+    import pandas
+    groups = self.check_parameters_for_validity(groups, "group", ('dev', 'eval'))
+
+    frames = []
+    for group in groups:
+      models = self._frame(self._clients_queries(protocol, group, None, gender), [('id', Client.id)])['id'].values
+      if shard is not None:
+        index, count = sharding.check_shard(shard)
+        models = numpy.sort(models)[index::count]
+      probes = self.objects_frame(protocol=protocol, purposes='probe', groups=group, gender=gender, device=device)
+      probes = probes.rename(columns={'id': 'probe_id', 'client_id': 'probe_client_id'})
+      trials = probes.iloc[numpy.tile(numpy.arange(len(probes)), len(models))].reset_index(drop=True)
+      trials.insert(0, 'model_id', numpy.repeat(models, len(probes)))
+      trials['target'] = trials['model_id'].values == trials['probe_client_id'].values
+      frames.append(trials)
+    return pandas.concat(frames, ignore_index=True)
+
+  def stats(self, protocol=None, groups=None, purposes=None, by=('client',), gender=None, device=None, arrays=False):
+    """Counts the Files of the given protocols, grouped by the given keys; the
+    counts are computed by the database, without loading any File.
+
+    Keyword Parameters:
+
+    protocol, gender, device
+      As in :py:meth:`objects`. If several protocols are given, a File that
+      belongs to several of them is counted once, unless 'protocol' is in
+      ``by``.
+
+    groups
+      The groups of the protocols ('dev', 'eval', 'world') or a tuple with
+      several of them. If 'None' is given (this is the default), it is
+      considered the same as a tuple with all possible values.
+
+    purposes
+      The purposes ('train', 'enroll', 'probe') or a tuple with several of
+      them. If 'None' is given (this is the default), it is considered the same
+      as a tuple with all possible values. Note that the Files of the 'world'
+      group have the 'train' purpose.
+
+    by
+      The keys of :py:data:`STATS_COLUMNS` to group the Files by, e.g.,
+      ('client', 'session', 'device'). With purposes='probe' and by='client',
+      the number of probe files of each client is returned. Since all probes
+      of a group are scored against each model of the group, the number of
+      probes per model is the one of by='group', and the number of trials of a
+      group is the product with the number of its :py:meth:`models`.
+
+    arrays
+      If set, a dictionary with a numpy array for each key in ``by`` and the
+      array of the ``'count'`` is returned.
+
+    Returns: A dictionary mapping each value of the key (or tuple of values of
+    the keys, if several are given) to the number of Files, sorted by keys.
+    """
+
+    protocol = self._replace_protocols_alias(protocol)
+    protocol = self.check_parameters_for_validity(protocol, "protocol", self.protocol_names())
+    groups = self.check_parameters_for_validity(groups, "group", self.groups())
+    purposes = self.check_parameters_for_validity(purposes, "purpose", self.purposes())
+    gender = self.check_parameters_for_validity(gender, "gender", self.genders(), [])
+    device = self.check_parameters_for_validity(device, "device", File.device_choices, [])
+    if isinstance(by, six.string_types): by = (by,)
+    unknown = [k for k in by if k not in STATS_COLUMNS]
+    if unknown:
+      raise ValueError("Cannot group the statistics by %s; choose among %s." % (', '.join(unknown), ', '.join(sorted(STATS_COLUMNS))))
+
+    from sqlalchemy import func, distinct
+    keys = [STATS_COLUMNS[k] for k in by]
+    q = self.query(*(keys + [func.count(distinct(File.id))])).select_from(File).join(Client).\
+          join((ProtocolPurpose, File.protocol_purposes)).join(Protocol).\
+          filter(and_(Protocol.name.in_(protocol), ProtocolPurpose.sgroup.in_(groups), ProtocolPurpose.purpose.in_(purposes)))
+    if gender:
+      q = q.filter(Client.gender.in_(gender))
+    if device:
+      q = q.filter(File.device.in_(device))
+    if keys:
+      q = q.group_by(*keys).order_by(*keys)
+    rows = q.all()
+
+    if arrays:
+      import numpy
+      retval = dict((k, numpy.array([r[i] for r in rows])) for i, k in enumerate(by))
+      retval['count'] = numpy.array([r[-1] for r in rows], dtype=numpy.int64)
+      return retval
+
+    import collections
+    if len(by) == 1:
+      return collections.OrderedDict((r[0], r[1]) for r in rows)
+    return collections.OrderedDict((tuple(r[:-1]), r[-1]) for r in rows)
 
   def annotations(self, file):
     """Reads the annotations for the given file id from file and returns them in a dictionary.
@@ -617,6 +1027,30 @@ class Database(bob.db.verification.utils.SQLiteDatabase, bob.db.verification.uti
     # return the annotations as read from file
     return bob.db.verification.utils.read_annotation_file(annotation_file, 'eyecenter')
 
+  def fingerprint(self):
+    """Returns the fingerprint of the database content, a SHA-256 hexadecimal
+    digest that changes whenever the content of the database changes.
+
+    It can be used as a key for caches of results derived from the database.
+    The fingerprint is stored when the database is created; for databases
+    created by older versions of this package, it is computed once per
+    Database object.
+    """
+
+    if self.m_fingerprint is None:
+      self.assert_validity()
+      from sqlalchemy.exc import OperationalError
+      try:
+        value = self.query(Metadata.value).filter(Metadata.name == 'fingerprint').scalar()
+      except OperationalError:
+        # the metadata table does not exist
+        self.m_session.rollback()
+        value = None
+      if value is None:
+        value = content_fingerprint(self.m_session)
+      self.m_fingerprint = str(value)
+    return self.m_fingerprint
+
   def protocol_names(self):
     """Returns all registered protocol names"""
 
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+#
+# Copyright (C) 2011-2013 Idiap Research Institute, Martigny, Switzerland
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Distribution of the files of the MOBIO database over jobs of balanced cost.
+
+The cost of processing a file is estimated either from static weights of its
+speech type and device, from the size of the file on disk, or read from a
+user-provided table. The files are then assigned to the jobs with the greedy
+longest-processing-time-first rule of :py:func:`bob.db.mobio.sharding.partition`.
+"""
+
+import os
+
+from .sharding import partition
+
+# the default relative costs of the files; free speech recordings are much
+# longer than the prompted ones
+STATIC_WEIGHTS = {
+  'speech_type': {'p': 1., 'l': 1., 'r': 1., 'f': 4.},
+  'device': {'mobile': 1., 'laptop': 1.5},
+}
+
+METHODS = ('static', 'size', 'table')
+
+def static_costs(files, weights=STATIC_WEIGHTS):
+  """Returns the cost of each file as the product of the weights of its
+  attributes; attributes or values without weight count as 1"""
+
+  costs = []
+  for f in files:
+    cost = 1.
+    for attribute, values in weights.items():
+      cost *= values.get(getattr(f, attribute), 1.)
+    costs.append(cost)
+  return costs
+
+def size_costs(files, directory=None, extension=None, workers=8):
+  """Returns the size in bytes of each file on disk, read by a pool of threads;
+  files that do not exist get the mean size of the others"""
+
+  from multiprocessing.pool import ThreadPool
+
+  def size(path):
+    try:
+      return float(os.path.getsize(path))
+    except OSError:
+      return None
+
+  pool = ThreadPool(max(workers, 1))
+  try:
+    sizes = pool.map(size, [f.make_path(directory, extension) for f in files])
+  finally:
+    pool.close()
+    pool.join()
+  known = [s for s in sizes if s is not None]
+  default = sum(known) / len(known) if known else 1.
+  return [default if s is None else s for s in sizes]
+
+def read_cost_table(filename):
+  """Reads a table of costs, with one file per line given by its id or its
+  path, followed by its cost (separated by white space or a comma); lines
+  starting with '#' are ignored. Returns a dictionary from the id (as an
+  integer) or the path to the cost"""
+
+  costs = {}
+  with open(filename) as f:
+    for line in f:
+      fields = line.replace(',', ' ').split()
+      if not fields or fields[0].startswith('#'): continue
+      if len(fields) != 2:
+        raise ValueError("The line '%s' of '%s' does not contain a file and its cost." % (line.strip(), filename))
+      key = int(fields[0]) if fields[0].isdigit() else fields[0]
+      costs[key] = float(fields[1])
+  return costs
+
+def table_costs(files, table):
+  """Returns the cost of each file from the given table (see
+  :py:func:`read_cost_table`), looked up by id, then by path; files that are
+  not in the table get the mean cost of the others"""
+
+  costs = [table.get(f.id, table.get(f.path)) for f in files]
+  known = [c for c in costs if c is not None]
+  default = sum(known) / len(known) if known else 1.
+  return [default if c is None else c for c in costs]
+
+def estimate_costs(files, method='static', directory=None, extension=None, table=None):
+  """Estimates the cost of each of the given files with one of the
+  :py:data:`METHODS`: the :py:data:`STATIC_WEIGHTS`, the size of the files in
+  the given ``directory`` with the given ``extension``, or the given cost
+  ``table`` (a dictionary, or the name of a file read with
+  :py:func:`read_cost_table`)"""
+
+  if method == 'static':
+    return static_costs(files)
+  if method == 'size':
+    return size_costs(files, directory, extension)
+  if method == 'table':
+    if table is None:
+      raise ValueError("A cost table is required for the 'table' method.")
+    if not isinstance(table, dict): table = read_cost_table(table)
+    return table_costs(files, table)
+  raise ValueError("The cost estimation method '%s' is not known; choose one of %s." % (method, ', '.join(METHODS)))
+
+def schedule(files, count, costs):
+  """Distributes the files over ``count`` jobs of balanced total cost.
+
+  Returns a tuple ``(shards, loads)``: the list of the files of each job (in
+  their original order) and the list of the total cost of each job."""
+
+  if count < 1:
+    raise ValueError("The number of jobs must be positive, not %d." % count)
+  assignment = partition(costs, count)
+  shards = [[] for _ in range(count)]
+  loads = [0.] * count
+  for f, c, s in zip(files, costs, assignment):
+    shards[s].append(f)
+    loads[s] += c
+  return shards, loads
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+#
+# Copyright (C) 2011-2013 Idiap Research Institute, Martigny, Switzerland
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""A local server answering queries to the MOBIO database, and its client.
+
+Many processes on the same machine can share the server and the cache of its
+responses; since SQLite connections cannot be shared between threads, each
+connection to the server queries its own database. The protocol is line based: each request is a JSON object
+``{"method": ..., "args": [...], "kwargs": {...}}`` on a single line, and each
+response is a JSON object on a single line, containing either the ``"error"``
+message or the result. Lists of database objects are sent as a ``"type"``, its
+``"columns"`` and the ``"rows"`` of values.
+"""
+
+import os
+import json
+import socket
+import threading
+import collections
+
+from six.moves import socketserver
+
+from .models import Client, Subworld, TModel, File, Protocol, ProtocolPurpose
+
+# the methods of the Database that can be called remotely
+METHODS = ('objects', 'tobjects', 'zobjects', 'clients', 'tclients', 'zclients',
+    'client', 'has_client_id', 'models', 'model_ids', 'tmodels', 'tmodel_ids',
+    'get_client_id_from_model_id', 'paths', 'reverse', 'groups', 'genders',
+    'subworld_names', 'has_subworld', 'protocol_names', 'has_protocol',
+    'purposes', 'fingerprint')
+
+# the classes of the objects that can be sent
+MODELS = dict((c.__name__, c) for c in (Client, Subworld, TModel, File, Protocol, ProtocolPurpose))
+
+def _columns(cls):
+  return [c.key for c in cls.__table__.columns]
+
+def encode(result):
+  """Encodes the result of a database query into a JSON-compatible object"""
+
+  if isinstance(result, (list, tuple)) and result and type(result[0]).__name__ in MODELS:
+    columns = _columns(type(result[0]))
+    return {'type': type(result[0]).__name__, 'columns': columns, 'rows': [[getattr(o, c) for c in columns] for o in result]}
+  if type(result).__name__ in MODELS:
+    columns = _columns(type(result))
+    return {'type': type(result).__name__, 'columns': columns, 'row': [getattr(result, c) for c in columns]}
+  return {'value': list(result) if isinstance(result, (tuple, set)) else result}
+
+def _instance(cls, columns, values):
+  # creates an object that is not attached to any session, without calling its constructor
+  o = cls.__mapper__.class_manager.new_instance()
+  for c, v in zip(columns, values): setattr(o, c, v)
+  return o
+
+def decode(response):
+  """Decodes the result encoded by :py:func:`encode`; database objects are
+  returned as detached instances of their classes, whose relationships cannot
+  be followed"""
+
+  if 'type' in response:
+    cls = MODELS[response['type']]
+    if 'row' in response:
+      return _instance(cls, response['columns'], response['row'])
+    return [_instance(cls, response['columns'], r) for r in response['rows']]
+  return response['value']
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+  def handle(self):
+    # each connection is handled by its own thread, which opens its own
+    # database on the first request that is not cached
+    self.db = None
+    try:
+      while True:
+        line = self.rfile.readline()
+        if not line: break
+        self.wfile.write(self.server.answer(line.decode('utf-8'), self.database))
+        self.wfile.flush()
+    finally:
+      if self.db is not None: self.db.close()
+
+  def database(self):
+    if self.db is None: self.db = self.server.open_database()
+    return self.db
+
+class _Server(object):
+  """Answers the requests with the database of the thread of each connection;
+  the encoded responses are cached, and shared between the connections"""
+
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def setup_database(self, kwargs, cache_size):
+    self.database_kwargs = kwargs
+    self.cache = collections.OrderedDict()
+    self.cache_size = cache_size
+    self.cache_lock = threading.Lock()
+
+  def open_database(self):
+    from .query import Database
+    return Database(**self.database_kwargs)
+
+  def answer(self, line, database):
+    """Returns the encoded response to the given request line; ``database``
+    returns the database of the current thread"""
+
+    try:
+      request = json.loads(line)
+      method = request['method']
+      if method not in METHODS:
+        raise ValueError("The method '%s' cannot be called remotely; choose one of %s." % (method, ', '.join(METHODS)))
+      key = json.dumps([method, request.get('args', []), request.get('kwargs', {})], sort_keys=True)
+    except Exception as e:
+      return self._error(e)
+
+    with self.cache_lock:
+      response = self.cache.get(key)
+    if response is not None:
+      return response
+
+    try:
+      result = getattr(database(), method)(*request.get('args', []), **request.get('kwargs', {}))
+      response = (json.dumps(encode(result), separators=(',', ':')) + '\n').encode('utf-8')
+    except Exception as e:
+      return self._error(e)
+
+    with self.cache_lock:
+      self.cache[key] = response
+      while len(self.cache) > self.cache_size:
+        self.cache.popitem(last=False)
+    return response
+
+  def _error(self, e):
+    return (json.dumps({'error': str(e), 'exception': type(e).__name__}) + '\n').encode('utf-8')
+
+class UnixServer(_Server, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  pass
+
+class TCPServer(_Server, socketserver.ThreadingMixIn, socketserver.TCPServer):
+  pass
+
+def _remove_stale_socket(address):
+  """Removes the given Unix domain socket, which is left over by a server that
+  is not running any more; raises an IOError if another server is listening
+  on it, or if it is not a socket"""
+
+  import stat
+  try:
+    mode = os.stat(address).st_mode
+  except OSError:
+    return
+  if not stat.S_ISSOCK(mode):
+    raise IOError("The file '%s' exists, and it is not a socket." % address)
+  probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    probe.connect(address)
+  except socket.error:
+    os.remove(address)
+    return
+  finally:
+    probe.close()
+  raise IOError("Another server is listening on the socket '%s'." % address)
+
+def make_server(address, cache_size=1024, **kwargs):
+  """Creates a server for the given address, which is either the name of a
+  Unix domain socket, or a ``(host, port)`` tuple; call ``serve_forever()`` on
+  it to answer requests, and ``shutdown()`` to stop it. The ``kwargs`` are
+  passed to the constructor of the :py:class:`bob.db.mobio.Database` opened
+  for each connection, e.g., the ``sqlite_file``. A socket left over by a
+  server that stopped is replaced, but an IOError is raised if another server
+  is listening on it."""
+
+  if isinstance(address, (tuple, list)):
+    server = TCPServer(tuple(address), _Handler)
+  else:
+    _remove_stale_socket(address)
+    server = UnixServer(address, _Handler)
+  server.setup_database(kwargs, cache_size)
+  return server
+
+
+class RemoteDatabase(object):
+  """Client of a server created by :py:func:`make_server`, which mirrors the
+  query methods of :py:class:`bob.db.mobio.Database`.
+
+  Keyword parameters:
+
+  address
+    The name of the Unix domain socket, or a ``(host, port)`` tuple.
+
+  original_directory, original_extension
+    Used by :py:meth:`original_file_names`, as in the Database.
+  """
+
+  def __init__(self, address, original_directory=None, original_extension=None):
+    if isinstance(address, (tuple, list)):
+      self.m_socket = socket.create_connection(tuple(address))
+    else:
+      self.m_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      self.m_socket.connect(address)
+    self.m_file = self.m_socket.makefile('rb')
+    self.m_lock = threading.Lock()
+    self.original_directory = original_directory
+    self.original_extension = original_extension
+
+  def close(self):
+    """Closes the connection to the server"""
+    self.m_file.close()
+    self.m_socket.close()
+
+  def call(self, method, *args, **kwargs):
+    """Calls the given method of the database on the server"""
+
+    request = (json.dumps({'method': method, 'args': args, 'kwargs': kwargs}) + '\n').encode('utf-8')
+    with self.m_lock:
+      self.m_socket.sendall(request)
+      line = self.m_file.readline()
+    if not line:
+      raise IOError("The connection to the database server was closed.")
+    response = json.loads(line.decode('utf-8'))
+    if 'error' in response:
+      import six
+      exception = getattr(six.moves.builtins, response['exception'], None)
+      if not (isinstance(exception, type) and issubclass(exception, Exception)): exception = RuntimeError
+      raise exception(response['error'])
+    return decode(response)
+
+  def original_file_names(self, files, check_existence=True):
+    """Returns the full paths of the given File objects"""
+    return [f.make_path(self.original_directory, self.original_extension) for f in files]
+
+def _remote(method):
+  def call(self, *args, **kwargs):
+    return self.call(method, *args, **kwargs)
+  call.__name__ = str(method)
+  call.__doc__ = "Calls :py:meth:`bob.db.mobio.Database.%s` on the server" % method
+  return call
+
+for _method in METHODS:
+  setattr(RemoteDatabase, _method, _remote(_method))
+del _method
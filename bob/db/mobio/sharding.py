@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# vim: set fileencoding=utf-8 :
+#
+# Copyright (C) 2011-2013 Idiap Research Institute, Martigny, Switzerland
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Deterministic partitioning of the data into shards, e.g., for the tasks of
+a job array. A shard is given as a tuple ``(index, count)``, with
+``0 <= index < count``.
+"""
+
+import heapq
+
+def check_shard(shard):
+  """Returns the given shard as a tuple of integers ``(index, count)``, or
+  raises a ValueError if it is invalid"""
+
+  try:
+    index, count = (int(v) for v in shard)
+  except (TypeError, ValueError):
+    raise ValueError("The shard '%s' is not a tuple (index, count)." % (shard,))
+  if count < 1 or not 0 <= index < count:
+    raise ValueError("The shard index %d is not in [0, %d)." % (index, count))
+  return index, count
+
+def partition(costs, count):
+  """Assigns each item, given by its cost, to one of ``count`` shards, with the
+  greedy longest-processing-time-first rule: the items are sorted by
+  decreasing cost (ties by position), and each is assigned to the shard with
+  the lowest total cost so far (ties by shard index).
+
+  Returns the list of the shard index of each item."""
+
+  assignment = [0] * len(costs)
+  loads = [(0., s) for s in range(count)]
+  for i in sorted(range(len(costs)), key=lambda i: (-costs[i], i)):
+    load, s = heapq.heappop(loads)
+    assignment[i] = s
+    heapq.heappush(loads, (load + costs[i], s))
+  return assignment
+
+def select(items, shard, cost):
+  """Returns the items of the given shard, keeping their order, when the items
+  are partitioned with :py:func:`partition` according to the given ``cost``
+  function of an item"""
+
+  index, count = check_shard(shard)
+  assignment = partition([cost(item) for item in items], count)
+  return [item for item, s in zip(items, assignment) if s == index]
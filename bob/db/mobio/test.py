@@ -404,6 +404,266 @@ def test_objects():
   assert len(db.zobjects(protocol='male', speech_type=['p','r','l','f'], model_ids=(204,))) == 192
 
 
+def _small_database(dbfile, files):
+  """Creates a database with the given files, each given by its id and the
+  arguments of the File constructor, in the given order; each file is
+  associated to a protocol purpose, a subworld and a T-Norm model"""
+
+  from sqlalchemy import create_engine
+  from sqlalchemy.orm import sessionmaker
+  from bob.db.mobio.models import Base, Client, File, protocolPurpose_file_association, subworld_file_association, tmodel_file_association
+
+  engine = create_engine('sqlite:///' + dbfile)
+  Base.metadata.create_all(engine)
+  session = sessionmaker(bind=engine)()
+  clients = []
+  for values in files:
+    if values[1] not in clients:
+      clients.append(values[1])
+      session.add(Client(values[1], 'dev', 'male', 'idiap'))
+  for values in files:
+    f = File(*values[1:])
+    f.id = values[0]
+    session.add(f)
+  session.flush()
+  for values in files:
+    session.execute(protocolPurpose_file_association.insert().values(protocolPurpose_id=values[0] % 2 + 1, file_id=values[0]))
+    session.execute(subworld_file_association.insert().values(subworld_id=values[0] % 3 + 1, file_id=values[0]))
+    session.execute(tmodel_file_association.insert().values(tmodel_id='t%d' % values[1], file_id=values[0]))
+  session.commit()
+  return session
+
+# files of a small database, whose ids are not in the order of the queries
+SMALL_FILES = [
+  (1, 2, 'idiap/m002/01_mobile/m002_01_p01_i0_0', 1, 'p', 1, 'i', 'mobile', 0),
+  (2, 1, 'idiap/m001/02_mobile/m001_02_p01_i0_0', 2, 'p', 1, 'i', 'mobile', 0),
+  (3, 1, 'idiap/m001/01_laptop/m001_01_r01_i0_1', 1, 'r', 1, 'i', 'laptop', 1),
+  (4, 1, 'idiap/m001/01_mobile/m001_01_p01_i0_0', 1, 'p', 1, 'i', 'mobile', 0),
+  (5, 2, 'idiap/m002/01_mobile/m002_01_f02_i0_0', 1, 'f', 2, 'i', 'mobile', 0),
+]
+
+
+def test_cluster_files():
+  # the files are renumbered in query order, and the associations follow them
+  import tempfile, shutil, sqlite3
+  from .create import finalize
+  directory = tempfile.mkdtemp()
+  try:
+    dbfile = os.path.join(directory, 'small.sql3')
+    _small_database(dbfile, SMALL_FILES).close()
+    tables = ('protocolPurpose_file_association', 'subworld_file_association', 'tmodel_file_association')
+    def associations(connection):
+      # the associations of each table, by path instead of file id
+      return dict((t, sorted(connection.execute('SELECT a.*, file.path FROM "%s" AS a JOIN file ON file.id = a.file_id' % t).fetchall(), key=lambda r: (r[2], r[0]))) for t in tables)
+    def by_path(rows):
+      return [(r[0], r[2]) for r in rows]
+
+    connection = sqlite3.connect(dbfile)
+    before = associations(connection)
+    connection.close()
+
+    finalize(dbfile, cluster=True)
+
+    connection = sqlite3.connect(dbfile)
+    ordered = connection.execute('SELECT id FROM file ORDER BY client_id, session_id, speech_type, shot_id, device').fetchall()
+    assert [r[0] for r in ordered] == [1, 2, 3, 4, 5]
+    after = associations(connection)
+    for t in tables:
+      assert len(after[t]) == len(SMALL_FILES)
+      assert by_path(after[t]) == by_path(before[t])
+    connection.close()
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_fingerprint():
+  # the fingerprint depends on the content, but not on the insertion order
+  import tempfile, shutil
+  from bob.db.mobio.models import content_fingerprint
+  from .create import add_fingerprint
+  directory = tempfile.mkdtemp()
+  try:
+    sessions = [_small_database(os.path.join(directory, 'small%d.sql3' % i), files) for i, files in enumerate((SMALL_FILES, SMALL_FILES[::-1]))]
+    fingerprints = [content_fingerprint(s) for s in sessions]
+    assert len(fingerprints[0]) == 64
+    assert fingerprints[0] == fingerprints[1]
+    sessions[1].execute(bob.db.mobio.File.__table__.update().where(bob.db.mobio.File.id == 1).values(shot_id=2))
+    assert content_fingerprint(sessions[1]) != fingerprints[0]
+    # the stored fingerprint is returned by the Database
+    add_fingerprint(sessions[0], 0)
+    for s in sessions: s.close()
+    assert bob.db.mobio.Database(sqlite_file=os.path.join(directory, 'small0.sql3')).fingerprint() == fingerprints[0]
+    # without a stored fingerprint, it is computed once per Database
+    db = bob.db.mobio.Database(sqlite_file=os.path.join(directory, 'small1.sql3'))
+    fingerprint = db.fingerprint()
+    statements = db.statement_count()
+    assert db.fingerprint() == fingerprint
+    assert db.statement_count() == statements
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_sort_manifest():
+  # the entries of each client directory are sorted, and the directories must be sorted
+  from .create import sort_by_directory
+  entries = [('idiap', 'm001', '02_mobile', 'a'), ('idiap', 'm001', '01_mobile', 'b'), ('idiap', 'm002', '01_mobile', 'a')]
+  assert list(sort_by_directory(entries, 'test')) == [entries[1], entries[0], entries[2]]
+  try:
+    list(sort_by_directory(entries[::-1], 'test'))
+  except RuntimeError:
+    pass
+  else:
+    raise AssertionError("An unsorted manifest was not detected")
+  # manifest files are sorted in any case
+  import tempfile, shutil
+  from .create import sorted_manifest
+  directory = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    manifest = os.path.join(directory, 'manifest.txt')
+    for order in (entries, entries[::-1]):
+      with open(manifest, 'w') as f:
+        f.write(''.join('/'.join(e) + '\n' for e in order))
+      assert list(sorted_manifest(manifest)) == [entries[1], entries[0], entries[2]]
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_build_report():
+  # the report records the statements and rows of the instrumented steps
+  import tempfile, shutil, json
+  from sqlalchemy import create_engine
+  from sqlalchemy.orm import sessionmaker
+  from .create import BuildReport, Progress, add_files
+  from .models import Base, File
+  engine = create_engine('sqlite://')
+  Base.metadata.create_all(engine)
+  session = sessionmaker(bind=engine)()
+  report = BuildReport()
+  report.attach(engine)
+  session.info['report'] = report
+  entries = [('idiap', 'm001', '01_mobile', 'm001_01_p01_i0_0'), ('idiap', 'm001', '01_mobile', 'm001_01_r01_i0_0')]
+  add_files(session, entries, 0)
+  assert session.query(File).count() == 2
+
+  directory = tempfile.mkdtemp()
+  try:
+    filename = os.path.join(directory, 'report.json')
+    report.save(filename)
+    with open(filename) as f:
+      data = json.load(f)
+  finally:
+    shutil.rmtree(directory)
+  assert list(data['sections']) == ['files']
+  files = data['sections']['files']
+  assert files['calls'] == 1
+  assert files['statements'] > 0
+  assert files['rows'] > 0
+  assert data['total']['statements'] >= files['statements']
+  assert data['total']['rows'] == files['rows']
+
+  # the progress is printed at most once per interval, with a verbosity of 2
+  import six
+  stdout = sys.stdout
+  sys.stdout = six.StringIO()
+  try:
+    progress = Progress('files added', 2, interval=0.)
+    progress()
+    progress(4)
+    quiet = Progress('files added', 1, interval=0.)
+    quiet()
+    output = sys.stdout.getvalue()
+  finally:
+    sys.stdout = stdout
+  assert progress.count == 5 and quiet.count == 1
+  assert output.count('files added') == 2
+  assert '5 files added' in output
+
+
+class _StubFile(object):
+  """Stands in for the File objects of the database in the checks of the filesystem"""
+
+  def __init__(self, id, path):
+    self.id = id
+    self.path = path
+
+  def make_path(self, directory=None, extension=None):
+    return os.path.join(directory or '', self.path) + (extension or '')
+
+def _stub_files(directory):
+  """Creates some of the files of a client in the given directory, and returns
+  them together with files of a missing session and of a missing client"""
+
+  os.makedirs(os.path.join(directory, 'c1', 's1'))
+  for name in ('a', 'b'):
+    open(os.path.join(directory, 'c1', 's1', name + '.png'), 'w').close()
+  files = [_StubFile(i+1, p) for i, p in enumerate(('c1/s1/a', 'c1/s1/b', 'c1/s1/c', 'c1/s1/d', 'c1/s2/a', 'c2/s1/a'))]
+  return files
+
+
+def test_check_files():
+  # the existing files are found by listing their directories
+  import tempfile, shutil
+  from .filesystem import check_files
+  directory = tempfile.mkdtemp()
+  try:
+    files = _stub_files(directory)
+    good, bad, missing = check_files(files, directory, '.png', workers=2)
+    assert [f.id for f in good] == [1, 2]
+    assert [f.id for f in bad] == [3, 4, 5, 6]
+    assert missing == [os.path.join(directory, 'c1', 's2'), os.path.join(directory, 'c2', 's1')]
+    # broken symbolic links do not exist, as for os.path.exists
+    if hasattr(os, 'symlink') and hasattr(os, 'scandir'):
+      os.symlink(os.path.join(directory, 'nowhere.png'), os.path.join(directory, 'c1', 's1', 'c.png'))
+      good, bad, missing = check_files(files, directory, '.png', workers=2)
+      assert [f.id for f in good] == [1, 2]
+  finally:
+    shutil.rmtree(directory)
+
+
+def test_stat_cache():
+  # unchanged directories are not listed again, unless a full check is requested
+  import tempfile, shutil
+  from .filesystem import check_files, StatCache
+  directory = tempfile.mkdtemp()
+  try:
+    files = _stub_files(os.path.join(directory, 'data'))
+    data = os.path.join(directory, 'data')
+    filename = os.path.join(directory, 'cache.json')
+    listed = []
+    def progress(done, total): listed.append(done)
+
+    cache = StatCache(filename, data, '.png')
+    good, bad, missing = check_files(files, data, '.png', progress=progress, cache=cache)
+    assert [f.id for f in good] == [1, 2]
+    assert len(listed) == 1
+    cache.save()
+
+    # remove a file without changing the modification time of its directory
+    session = os.path.join(data, 'c1', 's1')
+    mtime = os.stat(session).st_mtime
+    os.remove(os.path.join(session, 'b.png'))
+    os.utime(session, (mtime, mtime))
+
+    del listed[:]
+    cache = StatCache(filename, data, '.png')
+    good, bad, missing = check_files(files, data, '.png', progress=progress, cache=cache)
+    assert [f.id for f in good] == [1, 2]
+    assert len(listed) == 0
+    assert missing == [os.path.join(data, 'c1', 's2'), os.path.join(data, 'c2', 's1')]
+
+    good, bad, missing = check_files(files, data, '.png', progress=progress, cache=cache, full=True)
+    assert [f.id for f in good] == [1]
+    assert len(listed) == 1
+
+    # the cache is discarded for another directory or extension
+    cache.save()
+    assert StatCache(filename, data, '.png').directories
+    assert not StatCache(filename, data, '.jpg').directories
+    assert not StatCache(filename, directory, '.png').files
+  finally:
+    shutil.rmtree(directory)
+
+
 @db_available
 def test_annotations():
   # read some annotation files and test it's content
@@ -429,7 +689,438 @@ def test_driver_api():
   assert main('mobio dumplist --self-test'.split()) == 0
   assert main('mobio dumplist --protocol=mobile0-male --class=client --group=dev --purpose=enroll --client=115 --self-test'.split()) == 0
   assert main('mobio dumplist --protocol=male --class=client --group=dev --purpose=enroll --client=115 --self-test'.split()) == 0
+  assert main('mobio dumplist --format=csv --self-test'.split()) == 0
+  assert main('mobio dumplist --format=jsonl --ids-only --self-test'.split()) == 0
+  assert main('mobio dumplist --format=npy --self-test'.split()) == 0
   assert main('mobio checkfiles --self-test'.split()) == 0
   assert main('mobio reverse uoulu/m313/01_mobile/m313_01_p01_i0_0 --self-test'.split()) == 0
   assert main('mobio path 21132 --self-test'.split()) == 0
 
+  assert main('mobio manifest --self-test'.split()) == 0
+  assert main('mobio verify --self-test'.split()) == 0
+  assert main('mobio stats --by protocol group purpose --self-test'.split()) == 0
+  assert main('mobio serve --self-test'.split()) == 0
+  assert main('mobio schedule --shards=4 --protocol=mobile0-male --group dev --self-test'.split()) == 0
+
+
+@db_available
+def test_manifest():
+  # writes the manifest of the database and parses it back
+  import tempfile, shutil
+  from bob.db.base.script.dbmanage import main
+  from .create import list_manifest
+  db = bob.db.mobio.Database()
+  paths = sorted(f.path for f in db.query(bob.db.mobio.File))
+  tmpdir = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    for name in ('manifest.txt', 'manifest.txt.gz'):
+      filename = os.path.join(tmpdir, name)
+      assert main(('mobio manifest --output=%s' % filename).split()) == 0
+      stems = ['/'.join(e) for e in list_manifest(filename)]
+      assert stems == paths
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+@db_available
+def test_batch():
+  # runs several requests in one batch and compares with the single commands
+  import tempfile, shutil, json
+  from bob.db.base.script.dbmanage import main
+  db = bob.db.mobio.Database()
+  tmpdir = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    spec = os.path.join(tmpdir, 'spec.jsonl')
+    with open(spec, 'w') as f:
+      f.write(json.dumps({'command': 'dumplist', 'protocol': 'mobile0-male', 'group': 'dev', 'purpose': 'enroll', 'output': 'enroll.lst'}) + '\n')
+      f.write(json.dumps({'command': 'path', 'id': 21132, 'output': 'path.lst'}) + '\n')
+      f.write(json.dumps({'command': 'reverse', 'path': 'uoulu/m313/01_mobile/m313_01_p01_i0_0', 'output': 'reverse.lst'}) + '\n')
+    assert main(('mobio batch %s --directory=%s' % (spec, tmpdir)).split()) == 0
+    with open(os.path.join(tmpdir, 'enroll.lst')) as f:
+      assert sorted(f.read().split()) == sorted(o.path for o in db.objects(protocol='mobile0-male', groups='dev', purposes='enroll'))
+    with open(os.path.join(tmpdir, 'path.lst')) as f:
+      assert f.read().split() == db.paths([21132])
+    with open(os.path.join(tmpdir, 'reverse.lst')) as f:
+      assert [int(i) for i in f.read().split()] == [o.id for o in db.reverse(['uoulu/m313/01_mobile/m313_01_p01_i0_0'])]
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+@db_available
+def test_server():
+  # compares the results of a local server to the ones of the database
+  import tempfile, shutil, threading
+  from .server import make_server, RemoteDatabase
+  db = bob.db.mobio.Database()
+  tmpdir = tempfile.mkdtemp(prefix='bobtest_')
+  address = os.path.join(tmpdir, 'mobio.sock')
+  server = make_server(address)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.start()
+  try:
+    remote = RemoteDatabase(address)
+    for _ in range(2):
+      files = remote.objects(protocol='mobile0-male', groups='dev', purposes='probe')
+      assert sorted((f.id, f.make_path('x', '.png')) for f in files) == sorted((f.id, f.make_path('x', '.png')) for f in db.objects(protocol='mobile0-male', groups='dev', purposes='probe'))
+    assert sorted(c.id for c in remote.clients(groups='world')) == sorted(c.id for c in db.clients(groups='world'))
+    assert sorted(remote.tmodel_ids(protocol='mobile0-male')) == sorted(db.tmodel_ids(protocol='mobile0-male'))
+    assert remote.paths([21132]) == db.paths([21132])
+    # a second server cannot take over the socket
+    try:
+      make_server(address)
+      assert False, "a second server must not replace the socket of a running one"
+    except IOError:
+      pass
+    try:
+      remote.call('query')
+      assert False, "the 'query' method must not be callable remotely"
+    except ValueError:
+      pass
+    remote.close()
+  finally:
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    shutil.rmtree(tmpdir)
+
+
+def test_server_threads():
+  # concurrent clients are answered by the databases of the threads of the
+  # server; without cache, each request reaches the database
+  import tempfile, shutil, threading
+  from .server import make_server, RemoteDatabase
+  directory = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    dbfile = os.path.join(directory, 'small.sql3')
+    _small_database(dbfile, SMALL_FILES).close()
+    expected = sorted(c.id for c in bob.db.mobio.Database(sqlite_file=dbfile).clients())
+    address = os.path.join(directory, 'mobio.sock')
+    server = make_server(address, 0, sqlite_file=dbfile)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+      results = []
+      def run():
+        client = RemoteDatabase(address)
+        try:
+          for _ in range(5):
+            results.append(sorted(c.id for c in client.clients()))
+        except Exception as e:
+          results.append(e)
+        client.close()
+      clients = [threading.Thread(target=run) for _ in range(3)]
+      for t in clients: t.start()
+      for t in clients: t.join()
+      assert results == [expected] * 15, results
+      assert not server.cache
+    finally:
+      server.shutdown()
+      thread.join()
+      server.server_close()
+  finally:
+    shutil.rmtree(directory)
+
+
+@db_available
+def test_export():
+  # exports the database and compares the files and their enumerations
+  import tempfile, shutil
+  from bob.db.base.script.dbmanage import main
+  from .export import load
+  db = bob.db.mobio.Database()
+  files = sorted(db.query(bob.db.mobio.File), key=lambda f: f.id)
+  tmpdir = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    for format, name in (('npz', 'mobio.npz'), ('npz', 'bundle'), ('npy', 'mobio')):
+      output = os.path.join(tmpdir, name)
+      assert main(('mobio export %s --format=%s' % (output, format)).split()) == 0
+      table = load(output)['file']
+      assert list(table['id']) == [f.id for f in files]
+      assert list(table['path']) == [f.path for f in files]
+      assert [table['device.categories'][c] for c in table['device']] == [f.device for f in files]
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+@db_available
+def test_frames():
+  # compares the DataFrames to the objects returned by the query methods
+  try:
+    import pandas
+  except ImportError:
+    raise SkipTest("pandas is not available, the DataFrames can't be tested.")
+  db = bob.db.mobio.Database()
+  files = db.objects(protocol='mobile0-male', groups='dev', purposes='probe')
+  frame = db.objects_frame(protocol='mobile0-male', groups='dev', purposes='probe')
+  assert list(frame['id']) == sorted(f.id for f in files)
+  assert list(frame['path']) == [f.path for f in sorted(files, key=lambda f: f.id)]
+  assert list(frame['device'].cat.categories) == list(bob.db.mobio.File.device_choices)
+  assert list(db.clients_frame(groups='world')['id']) == [c.id for c in db.clients(groups='world')]
+  trials = db.trials_frame(protocol='mobile0-male', groups='dev')
+  models = db.model_ids(protocol='mobile0-male', groups='dev')
+  assert len(trials) == len(models) * len(files)
+  assert trials['target'].sum() == sum(len([f for f in files if f.client_id == m]) for m in models)
+
+
+@db_available
+def test_eager_loading():
+  # the eagerly loaded relationships do not issue any further statement
+  db = bob.db.mobio.Database()
+  files = db.objects(protocol='mobile0-male', groups='dev', load=('client', 'subworld'))
+  count = db.statement_count()
+  assert len(set(f.client.institute for f in files)) > 1
+  assert all(f.subworld == [] for f in files)
+  assert db.statement_count() == count
+  tmodels = db.tmodels(protocol='mobile0-male', load=('files',))
+  count = db.statement_count()
+  assert all(len(t.files) > 0 for t in tmodels)
+  assert db.statement_count() == count
+
+
+@db_available
+def test_lazy_load_warning():
+  # in debug mode, loading the relationships one by one is reported at once
+  import warnings
+  db = bob.db.mobio.Database()
+  db.debug = True
+  with warnings.catch_warnings(record=True) as caught:
+    warnings.simplefilter('always')
+    files = db.objects(protocol='mobile0-male', groups='dev', load=('client',))
+    clients = set(f.client.id for f in files)
+    assert len(clients) > 10
+    assert not caught
+    # a new database, whose session does not hold the clients yet
+    db = bob.db.mobio.Database()
+    db.debug = True
+    files = db.objects(protocol='mobile0-male', groups='dev')
+    clients = set(f.client.id for f in files)
+    assert len(caught) == 1
+    assert "'load' parameter of objects()" in str(caught[0].message)
+
+
+@db_available
+def test_stats():
+  # compares the counts to the ones of the queried files
+  import collections
+  db = bob.db.mobio.Database()
+  files = db.objects(protocol='mobile0-male', groups='dev', purposes='probe')
+  assert db.stats(protocol='mobile0-male', groups='dev', purposes='probe', by='client') == collections.Counter(f.client_id for f in files)
+  # each model is scored against all probes of its group
+  assert db.stats(protocol='mobile0-male', groups='dev', purposes='probe', by='group') == {'dev': len(files)}
+  counts = db.stats(protocol='mobile0-male', groups=('dev', 'eval'), purposes='enroll', by=('client', 'device'))
+  assert sum(counts.values()) == len(db.objects(protocol='mobile0-male', groups=('dev', 'eval'), purposes='enroll'))
+  arrays = db.stats(protocol='mobile0-male', by=('group', 'purpose'), arrays=True)
+  assert len(arrays['group']) == len(arrays['count']) == 5
+
+
+@db_available
+def test_generate_filelist():
+  # compares the generated lists to the queried files
+  import tempfile, shutil
+  from .generate_filelist import generate
+  db = bob.db.mobio.Database()
+  tmpdir = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    lines = generate('mobile0-male', tmpdir, db=db)
+    with open(os.path.join(tmpdir, 'mobile0-male', 'dev', 'for_models.lst')) as f:
+      assert f.read().split('\n')[:-1] == ['%s %03d %03d' % (p, c, c) for p, c in sorted(set((o.path, o.client_id) for o in db.objects(protocol='mobile0-male', groups='dev', purposes='enroll')))]
+    probes = set(o.path for o in db.objects(protocol='mobile0-male', groups='eval', purposes='probe'))
+    models = db.model_ids(protocol='mobile0-male', groups='eval')
+    with open(os.path.join(tmpdir, 'mobile0-male', 'eval', 'for_scores.lst')) as f:
+      scores = f.read().split('\n')[:-1]
+    assert len(scores) == lines['eval/for_scores.lst'] == len(probes) * len(models)
+    assert set(l.split()[0] for l in scores) == probes
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+@db_available
+def test_generate_all_filelists():
+  # generates two protocols in both variants in parallel
+  import tempfile, shutil
+  from .generate_filelist import generate_all
+  tmpdir = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    results = generate_all(('mobile0-male', 'mobile0-female'), tmpdir, (False, True), jobs=2)
+    assert [(r[0], r[1]) for r in results] == [('mobile0-male', False), ('mobile0-male', True), ('mobile0-female', False), ('mobile0-female', True)]
+    for name in ('mobile0-male', 'mobile0-male_GD', 'mobile0-female', 'mobile0-female_GD'):
+      assert os.path.exists(os.path.join(tmpdir, name, 'eval', 'for_scores.lst'))
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+@db_available
+def test_generate_filelist_manifest():
+  # unchanged lists are neither generated nor written again
+  import tempfile, shutil
+  from .generate_filelist import generate, read_manifest
+  db = bob.db.mobio.Database()
+  tmpdir = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    lines = generate('mobile0-female', tmpdir, db=db)
+    base_dir = os.path.join(tmpdir, 'mobile0-female')
+    manifest = read_manifest(base_dir)
+    assert manifest['fingerprint'] == db.fingerprint()
+    assert sorted(manifest['files']) == sorted(lines)
+    filename = os.path.join(base_dir, 'dev', 'for_scores.lst')
+    os.utime(filename, (0, 0))
+    assert generate('mobile0-female', tmpdir, db=db) == lines
+    assert generate('mobile0-female', tmpdir, db=db, force=True) == lines
+    assert os.path.getmtime(filename) == 0
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+@db_available
+def test_compact_trials():
+  # the compact trials expand to the same pairs as the list of all pairs
+  import tempfile, shutil
+  from .generate_filelist import generate
+  from . import filelists
+  db = bob.db.mobio.Database()
+  tmpdir = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    generate('mobile0-male', os.path.join(tmpdir, 'expanded'), db=db)
+    generate('mobile0-male', os.path.join(tmpdir, 'compact'), db=db, compact=True)
+    compact = os.path.join(tmpdir, 'compact', 'mobile0-male', 'dev')
+    expected = filelists.read_for_scores(os.path.join(tmpdir, 'expanded', 'mobile0-male', 'dev', 'for_scores.lst'))
+    assert list(filelists.iter_trials(compact)) == expected
+    models, probes, probe_index, model_index = filelists.trial_indices(compact)
+    assert [(probes[p][0], models[m]) for p, m in zip(probe_index, model_index)] == [(e[0], e[1]) for e in expected]
+    assert not os.path.exists(os.path.join(compact, 'for_scores.lst'))
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+@db_available
+def test_filelist_formats():
+  # the lists read back from all formats are identical to the text lists
+  import tempfile, shutil
+  from .generate_filelist import generate
+  from . import filelists
+  db = bob.db.mobio.Database()
+  tmpdir = tempfile.mkdtemp(prefix='bobtest_')
+  try:
+    expected = None
+    for format in ('text', 'gz', 'npz'):
+      generate('mobile0-male', os.path.join(tmpdir, format), db=db, format=format)
+      base_dir = os.path.join(tmpdir, format, 'mobile0-male')
+      lists = [filelists.read_list(filelists.find_list(os.path.join(base_dir, d), n)) for d, n in (('norm', 'train_world.lst'), ('dev', 'for_models.lst'), ('eval', 'for_scores.lst'))]
+      if expected is None: expected = lists
+      assert lists == expected
+    assert os.path.exists(os.path.join(tmpdir, 'npz', 'mobile0-male', 'eval', 'for_scores.npz'))
+  finally:
+    shutil.rmtree(tmpdir)
+
+
+@db_available
+def test_shards():
+  # the shards partition the files and the trials
+  db = bob.db.mobio.Database()
+  files = db.objects(protocol='mobile0-male', groups='dev')
+  assert files == db.objects(protocol='mobile0-male', groups='dev')
+  for cost in (None, lambda f: len(f.path)):
+    shards = [db.objects(protocol='mobile0-male', groups='dev', shard=(i, 3), shard_cost=cost) for i in range(3)]
+    assert sorted(f.id for shard in shards for f in shard) == sorted(f.id for f in files)
+    assert all(len(shard) > 0 for shard in shards)
+  zfiles = db.zobjects(protocol='mobile0-male')
+  assert sorted(f.id for i in range(2) for f in db.zobjects(protocol='mobile0-male', shard=(i, 2))) == sorted(f.id for f in zfiles)
+  tfiles = db.tobjects(protocol='mobile0-male')
+  assert sorted(f.id for i in range(2) for f in db.tobjects(protocol='mobile0-male', shard=(i, 2))) == sorted(f.id for f in tfiles)
+
+
+@db_available
+def test_schedule():
+  # the scheduler distributes all files over balanced shards
+  from .scheduler import estimate_costs, schedule
+  db = bob.db.mobio.Database()
+  files = db.objects(protocol='mobile0-male', groups='dev')
+  costs = estimate_costs(files)
+  assert len(costs) == len(files)
+  assert all(c == 4. for f, c in zip(files, costs) if f.speech_type == 'f' and f.device == 'mobile')
+  shards, loads = schedule(files, 5, costs)
+  assert sorted(f.id for shard in shards for f in shard) == sorted(f.id for f in files)
+  assert max(loads) - min(loads) <= max(costs)
+  # the cost table is looked up by id and by path
+  costs = estimate_costs(files[:2], 'table', table={files[0].id: 3., files[1].path: 5.})
+  assert costs == [3., 5.]
+  # sizes of missing files default to 1
+  assert estimate_costs(files[:3], 'size', directory='/non/existent') == [1., 1., 1.]
+
+
+@db_available
+def test_async():
+  # the awaitable queries return the same results as the database
+  if sys.version_info < (3, 4):
+    raise SkipTest("The asynchronous database requires Python 3.4 or later")
+  import asyncio
+  from .asyncdb import AsyncDatabase
+  db = bob.db.mobio.Database()
+  loop = asyncio.new_event_loop()
+  adb = AsyncDatabase(workers=2, loop=loop)
+  try:
+    files = loop.run_until_complete(adb.objects(protocol='mobile0-male', groups='dev'))
+    assert [f.id for f in files] == [f.id for f in db.objects(protocol='mobile0-male', groups='dev')]
+    results = loop.run_until_complete(adb.batch([('models', (), {'protocol': 'mobile0-male'}), ('reverse', (['uoulu/m313/01_mobile/m313_01_p01_i0_0'],))] * 10))
+    assert len(results) == 20
+    assert [m.id for m in results[0]] == [m.id for m in db.models(protocol='mobile0-male')]
+    assert len(results[1]) == 1
+  finally:
+    adb.close()
+    loop.close()
+
+
+@db_available
+def test_profiling():
+  # the calls are recorded once profiling is enabled, and sent to the hooks
+  db = bob.db.mobio.Database()
+  assert db.profile_report() == {}
+  calls = []
+  db.enable_profiling(hooks=[lambda *args: calls.append(args)])
+  for i in range(3):
+    files = db.objects(protocol='mobile0-male', groups='dev')
+  db.reverse(['uoulu/m313/01_mobile/m313_01_p01_i0_0'])
+  report = db.profile_report()
+  assert report['objects']['calls'] == 3
+  assert report['objects']['rows'] == 3 * len(files)
+  assert report['objects']['statements'] >= 3
+  assert report['objects']['p50'] <= report['objects']['p99']
+  assert report['reverse']['calls'] == 1
+  assert len(calls) == 4 and calls[0][0] == 'objects'
+  # the clients queried by the models are part of the call to models
+  db.models(protocol='mobile0-male')
+  assert db.profile_report()['models']['calls'] == 1
+  assert 'clients' not in db.profile_report()
+  # a failing hook issues a warning
+  import warnings
+  db.enable_profiling(hooks=[lambda *args: 1 / 0])
+  with warnings.catch_warnings(record=True) as caught:
+    warnings.simplefilter('always')
+    db.clients()
+  assert len(caught) == 1 and 'clients' in str(caught[0].message)
+  assert db.profile_report()['clients']['calls'] == 1
+
+
+@db_available
+def test_benchmark():
+  # the synthetic database replicates all files, and the regressions are found
+  import tempfile, shutil
+  from .benchmark import make_synthetic, regressions
+  from .driver import Interface
+  directory = tempfile.mkdtemp()
+  try:
+    synthetic = os.path.join(directory, 'synthetic.sql3')
+    make_synthetic(Interface().files()[0], synthetic, 2)
+    db = bob.db.mobio.Database()
+    sdb = bob.db.mobio.Database(sqlite_file=synthetic)
+    assert len(sdb.objects(protocol='mobile0-male', groups='dev')) == 2 * len(db.objects(protocol='mobile0-male', groups='dev'))
+    assert len(sdb.clients()) == len(db.clients())
+    assert sdb.fingerprint() != db.fingerprint()
+    # the fingerprint of the synthetic database is stored
+    import sqlite3
+    connection = sqlite3.connect(synthetic)
+    assert connection.execute("SELECT value FROM metadata WHERE name = 'fingerprint'").fetchone()[0] == sdb.fingerprint()
+    connection.close()
+  finally:
+    shutil.rmtree(directory)
+  assert regressions({'a': 0.1, 'b': 0.1}, {'a': 0.05, 'b': 0.095}) == [('a', 0.05, 0.1)]
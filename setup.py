@@ -57,6 +57,7 @@ setup(
       # scripts
       'console_scripts': [
         'generate_filelist = bob.db.mobio.generate_filelist:main',
+        'mobio_benchmark = bob.db.mobio.benchmark:main',
       ],
     },
 